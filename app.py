@@ -1,20 +1,47 @@
-from dash import Dash, dcc
+from dash import Dash, DiskcacheManager, dcc
 
 from callbacks.callbacks import register_callbacks
-from constants import STAGE
+from constants import (
+    BACKGROUND_CACHE_DIR,
+    BACKGROUND_CALLBACKS,
+    CLIENTSIDE_CHARTS,
+    STAGE,
+    WARMUP,
+)
 from layouts.content import content
 from layouts.devbar import devbar
 from layouts.modal import disclaimer_modal
 from layouts.navbar import module_bar, navbar
+from routes.routes import register_routes
+from utils.chart_utils import get_chart_styles
 from utils.log_utils import setup_logging
-
-app = Dash(__name__, update_title=None, suppress_callback_exceptions=True)
+from utils.warmup_utils import start_warmup
+
+background_callback_manager = None
+if BACKGROUND_CALLBACKS:
+    # Only needed for background callbacks
+    import diskcache
+
+    background_callback_manager = DiskcacheManager(
+        diskcache.Cache(BACKGROUND_CACHE_DIR)
+    )
+
+app = Dash(
+    __name__,
+    update_title=None,
+    suppress_callback_exceptions=True,
+    background_callback_manager=background_callback_manager,
+)
 server = app.server
 app.title = "Flood Exposure"
 
 logger = setup_logging()
 
 register_callbacks(app)
+register_routes(app)
+if WARMUP:
+    start_warmup()
+
 layout = [
     disclaimer_modal(),
     navbar(),
@@ -23,6 +50,9 @@ layout = [
     dcc.Store(id="selected-data"),
 ]
 
+if CLIENTSIDE_CHARTS:
+    layout.append(dcc.Store(id="chart-styles", data=get_chart_styles()))
+
 if STAGE == "dev":
     layout.insert(1, devbar())
 
@@ -0,0 +1,158 @@
+// Draws the timeseries and return period charts with CLIENTSIDE_CHARTS, from
+// the series sent by the server (see get_chart_data in utils/chart_utils.py)
+// and the layouts sent once with the page (see get_chart_styles). Gives the
+// same figures as create_timeseries_plot and create_return_period_plot.
+(function () {
+    const DAY_MS = 24 * 60 * 60 * 1000;
+
+    // Date in 1900 of a day of the year, in milliseconds since the epoch
+    function dayToDate(day) {
+        return Date.UTC(1900, 0, day);
+    }
+
+    // Trace of a daily series, by its first date and a one-day step, with
+    // missing days as gaps, as with COMPACT_TIMESERIES
+    function toDaily(series) {
+        return {x0: dayToDate(series.start), dx: DAY_MS, y: series.values};
+    }
+
+    function withLayout(layout, changes) {
+        return Object.assign({}, layout, changes);
+    }
+
+    function timeseriesFigure(data, styles) {
+        const {blue, red, grey} = styles.colors;
+        const traces = [
+            Object.assign(toDaily(data.seasonal), {
+                type: "scatter",
+                name: "Average",
+                line: {color: "black", width: 2},
+            }),
+        ];
+
+        data.years
+            .slice()
+            .reverse()
+            .forEach((year) => {
+                const isCurrent = year.year === data.cur_year;
+                const isPeak = data.peak_years.includes(year.year);
+                traces.push(
+                    Object.assign(toDaily(year), {
+                        type: "scatter",
+                        name: String(year.year),
+                        mode: "lines",
+                        line: {
+                            color: isCurrent || !isPeak ? blue : red,
+                            width: isCurrent ? 3 : 0.2,
+                        },
+                    })
+                );
+            });
+
+        // Highlight most recent date
+        const [, month, day] = data.date_max.split("-").map(Number);
+        const dateMax = Date.UTC(1900, month - 1, day);
+        const layout = styles.timeseries_layout;
+        return {
+            data: traces,
+            layout: withLayout(layout, {
+                yaxis: Object.assign({}, layout.yaxis, {dtick: data.timeseries_dtick}),
+                shapes: [
+                    {
+                        type: "line",
+                        x0: dateMax,
+                        x1: dateMax,
+                        xref: "x",
+                        y0: 0,
+                        y1: 1,
+                        yref: "y domain",
+                        line: {color: grey, dash: "dash", width: 1},
+                        opacity: 1,
+                    },
+                ],
+                annotations: [
+                    {
+                        x: dateMax,
+                        xref: "x",
+                        xanchor: "left",
+                        y: 1,
+                        yref: "y domain",
+                        yanchor: "top",
+                        text: `  Data updated<br>${data.date_max}`,
+                        showarrow: false,
+                        font: {color: grey},
+                    },
+                ],
+            }),
+        };
+    }
+
+    function returnPeriodFigure(data, styles) {
+        const {blue, red} = styles.colors;
+        const peaks = data.peaks;
+        const traces = [
+            {
+                type: "scatter",
+                x: peaks.rp,
+                y: peaks.value,
+                name: "all years",
+                mode: "lines",
+                line: {color: "#353535"},
+            },
+        ];
+
+        // Add point for current year
+        const cur = peaks.year.indexOf(data.cur_year);
+        if (cur !== -1) {
+            const rank = peaks.rank[cur];
+            const position =
+                rank === 1 ? "bottom left" : rank === peaks.year.length ? "top right" : "bottom right";
+            traces.push({
+                type: "scatter",
+                x: [peaks.rp[cur]],
+                y: [peaks.value[cur]],
+                name: "current year",
+                mode: "markers+text",
+                text: data.cur_year,
+                textposition: position,
+                marker: {color: blue, size: 10},
+                textfont: {size: 15, color: blue},
+            });
+        }
+
+        // Add other significant years
+        const significant = peaks.year
+            .map((year, i) => i)
+            .filter((i) => peaks.is_rp[i] && peaks.year[i] !== data.cur_year);
+        traces.push({
+            type: "scatter",
+            x: significant.map((i) => peaks.rp[i]),
+            y: significant.map((i) => peaks.value[i]),
+            text: significant.map((i) => peaks.year[i]),
+            name: "≥3-yr RP years",
+            textposition: "top left",
+            mode: "markers+text",
+            marker: {color: red, size: 5},
+            textfont: {size: 12, color: red},
+        });
+
+        const layout = styles.rp_layout;
+        return {
+            data: traces,
+            layout: withLayout(layout, {
+                yaxis: Object.assign({}, layout.yaxis, {dtick: data.rp_dtick}),
+            }),
+        };
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        charts: {
+            draw_charts: function (data, styles) {
+                if (!data || !styles) {
+                    return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+                }
+                return [timeseriesFigure(data, styles), returnPeriodFigure(data, styles)];
+            },
+        },
+    });
+})();
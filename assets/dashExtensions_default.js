@@ -5,9 +5,11 @@ window.dashExtensions = Object.assign({}, window.dashExtensions, {
                 colorscale,
                 style,
                 colorProp,
-                selected
+                selected,
+                quantiles
             } = context.hideout; // get props from hideout
-            const value = feature.properties[colorProp]; // get value that determines the color
+            // get value that determines the color, from the hideout if the features don't have it
+            const value = quantiles ? quantiles[feature.properties.pcode] : feature.properties[colorProp];
             let featureStyle = {
                 ...style
             };
@@ -0,0 +1,25 @@
+// Selects or deselects the clicked location on the map, in the browser, so
+// clicking doesn't send the hideout (with all the quantiles, for some map
+// formats) to the server and back. See toggle_select in callbacks.py.
+(function () {
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        map: {
+            toggle_select: function (n_clicks, feature, hideout) {
+                if (!n_clicks || !feature) {
+                    return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+                }
+                let properties = feature.properties;
+                const pcode = properties.pcode;
+                const selected = hideout.selected === pcode ? "" : pcode;
+                if (hideout.quantiles) {
+                    // The boundaries don't have the quantiles joined on
+                    const quantile = hideout.quantiles[pcode];
+                    properties = Object.assign({}, properties, {
+                        quantile: quantile === undefined ? null : quantile,
+                    });
+                }
+                return [properties, Object.assign({}, hideout, {selected: selected})];
+            },
+        },
+    });
+})();
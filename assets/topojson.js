@@ -0,0 +1,87 @@
+// Loads the TopoJSON boundaries used with MAP_FORMAT=topojson, converting
+// them to the GeoJSON that the map layer expects. Only the parts of the
+// format written by download_geodata.py are supported: quantized,
+// delta-encoded arcs making up polygons and multipolygons.
+(function () {
+    // Converted boundaries, keyed by URL
+    const cache = {};
+
+    function decodeArcs(topology) {
+        if (!topology.transform) {
+            return topology.arcs;
+        }
+        const {scale, translate} = topology.transform;
+        return topology.arcs.map((arc) => {
+            let x = 0;
+            let y = 0;
+            return arc.map(([dx, dy]) => {
+                x += dx;
+                y += dy;
+                return [x * scale[0] + translate[0], y * scale[1] + translate[1]];
+            });
+        });
+    }
+
+    function decodeRing(arcs, indexes) {
+        const coordinates = [];
+        indexes.forEach((index, i) => {
+            // Negative indexes are arcs to follow backwards
+            const arc = index < 0 ? arcs[~index].slice().reverse() : arcs[index];
+            // Each arc starts where the previous one ended
+            coordinates.push(...(i > 0 ? arc.slice(1) : arc));
+        });
+        return coordinates;
+    }
+
+    function decodeGeometry(arcs, geometry) {
+        const decodePolygon = (rings) => rings.map((ring) => decodeRing(arcs, ring));
+        if (geometry.type === "Polygon") {
+            return {type: "Polygon", coordinates: decodePolygon(geometry.arcs)};
+        }
+        if (geometry.type === "MultiPolygon") {
+            return {type: "MultiPolygon", coordinates: geometry.arcs.map(decodePolygon)};
+        }
+        return null;
+    }
+
+    function toGeoJSON(topology) {
+        const arcs = decodeArcs(topology);
+        const features = [];
+        Object.values(topology.objects).forEach((object) => {
+            const geometries = object.type === "GeometryCollection" ? object.geometries : [object];
+            geometries.forEach((geometry) => {
+                features.push({
+                    type: "Feature",
+                    properties: geometry.properties || {},
+                    geometry: decodeGeometry(arcs, geometry),
+                });
+            });
+        });
+        return {type: "FeatureCollection", features: features};
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        boundaries: {
+            load_topojson: function (url) {
+                if (!url) {
+                    return window.dash_clientside.no_update;
+                }
+                if (!cache[url]) {
+                    cache[url] = fetch(url)
+                        .then((response) => {
+                            if (!response.ok) {
+                                throw new Error(`Failed to load ${url}: ${response.status}`);
+                            }
+                            return response.json();
+                        })
+                        .then(toGeoJSON)
+                        .catch((error) => {
+                            delete cache[url];
+                            throw error;
+                        });
+                }
+                return cache[url];
+            },
+        },
+    });
+})();
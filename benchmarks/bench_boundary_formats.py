@@ -0,0 +1,125 @@
+"""Compare the size and parse time of the boundaries as GeoJSON and TopoJSON.
+
+TopoJSON files are read from assets/geo if download_geodata.py has written
+them, otherwise they are encoded from the GeoJSON with the same settings.
+Parsing TopoJSON includes converting it back to GeoJSON features, as done in
+the browser by assets/topojson.js.
+
+Run from the repo root with:
+
+    python -m benchmarks.bench_boundary_formats
+"""
+
+import gzip
+import json
+import os
+import timeit
+
+import geopandas as gpd
+
+from download_geodata import to_topojson
+from utils.geo_utils import get_boundary_path, get_topojson_path
+
+ADM_LEVELS = ["0", "1", "2", "region"]
+N_RUNS = 5
+
+
+def decode_arcs(topology):
+    scale, translate = (
+        topology["transform"]["scale"],
+        topology["transform"]["translate"],
+    )
+    arcs = []
+    for arc in topology["arcs"]:
+        x = y = 0
+        points = []
+        for dx, dy in arc:
+            x += dx
+            y += dy
+            points.append(
+                [x * scale[0] + translate[0], y * scale[1] + translate[1]]
+            )
+        arcs.append(points)
+    return arcs
+
+
+def decode_ring(arcs, indexes):
+    coordinates = []
+    for i, index in enumerate(indexes):
+        arc = arcs[~index][::-1] if index < 0 else arcs[index]
+        coordinates.extend(arc[1:] if i > 0 else arc)
+    return coordinates
+
+
+def topojson_to_features(topology):
+    """Python version of the conversion in assets/topojson.js."""
+    arcs = decode_arcs(topology)
+    features = []
+    for obj in topology["objects"].values():
+        for geometry in obj["geometries"]:
+            if geometry["type"] == "Polygon":
+                coordinates = [
+                    decode_ring(arcs, ring) for ring in geometry["arcs"]
+                ]
+            elif geometry["type"] == "MultiPolygon":
+                coordinates = [
+                    [decode_ring(arcs, ring) for ring in polygon]
+                    for polygon in geometry["arcs"]
+                ]
+            else:
+                continue
+            features.append(
+                {
+                    "type": "Feature",
+                    "properties": geometry.get("properties", {}),
+                    "geometry": {
+                        "type": geometry["type"],
+                        "coordinates": coordinates,
+                    },
+                }
+            )
+    return {"type": "FeatureCollection", "features": features}
+
+
+def describe(name, body, parse):
+    t = timeit.timeit(parse, number=N_RUNS) / N_RUNS
+    return (
+        f"  {name:<8} {len(body) / 1e3:>9.1f} kB, "
+        f"{len(gzip.compress(body)) / 1e3:>8.1f} kB gzipped, "
+        f"parsed in {t * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    for adm_level in ADM_LEVELS:
+        path = get_boundary_path(adm_level)
+        if not os.path.exists(path):
+            print(f"No boundaries for admin {adm_level}, skipping")
+            continue
+        with open(path, "rb") as file:
+            geojson = file.read()
+        topojson_path = get_topojson_path(adm_level)
+        if os.path.exists(topojson_path):
+            with open(topojson_path, "rb") as file:
+                topojson = file.read()
+        else:
+            topojson = to_topojson(gpd.read_file(path)).encode()
+
+        topology = json.loads(topojson)
+        n_features = len(topojson_to_features(topology)["features"])
+        assert n_features == len(json.loads(geojson)["features"])
+
+        print(f"adm{adm_level} ({n_features} features):")
+        print(describe("GeoJSON", geojson, lambda: json.loads(geojson)))
+        print(
+            describe(
+                "TopoJSON",
+                topojson,
+                lambda: topojson_to_features(json.loads(topojson)),
+            )
+        )
+        print(
+            f"  {len(geojson) / len(topojson):.1f}x smaller, "
+            f"{len(gzip.compress(geojson)) / len(gzip.compress(topojson)):.1f}"
+            "x smaller gzipped"
+        )
@@ -0,0 +1,95 @@
+"""Compare the old row-wise admin name selection in clean_gdf against the
+vectorized one, on the admin 2 boundaries of all countries.
+
+The CODABs are read from CODAB_CACHE_DIR if download_geodata.py has
+downloaded them, otherwise a synthetic set of about the same size is used.
+
+Run from the repo root with:
+
+    python -m benchmarks.bench_clean_gdf
+"""
+
+import os
+import random
+import timeit
+
+import geopandas as gpd
+import pandas as pd
+from shapely.geometry import Point
+
+from constants import ISO3S
+from download_geodata import clean_gdf
+from utils import codab_utils
+
+ADM_LEVEL = 2
+# Roughly the number of admin 2 areas across all countries
+N_SYNTHETIC = 2000
+N_RUNS = 5
+
+
+def clean_gdf_apply(gdf, adm_level):
+    """The name selection as previously done in clean_gdf."""
+    gdf["name"] = gdf.apply(
+        lambda row: (
+            row[f"ADM{adm_level}_FR"]
+            if pd.notna(row.get(f"ADM{adm_level}_FR"))
+            and row.get(f"ADM{adm_level}_FR") != ""
+            else row.get(f"ADM{adm_level}_EN", "")
+        ),
+        axis=1,
+    )
+    gdf.rename(columns={f"ADM{adm_level}_PCODE": "pcode"}, inplace=True)
+    gdf = gdf[["pcode", "name", "geometry"]]
+    return gdf
+
+
+def load_codabs(adm_level):
+    gdfs = []
+    for iso3 in ISO3S:
+        if not os.path.exists(codab_utils.get_codab_path(iso3)):
+            return None
+        gdfs.append(codab_utils.load_codab(iso3, admin_level=adm_level))
+    return pd.concat(gdfs, ignore_index=True)
+
+
+def make_codabs(adm_level, n):
+    """Make CODAB-like boundaries, with French names for some areas only."""
+    random.seed(0)
+    fr = [random.choice([f"Nom {i}", "", None]) for i in range(n)]
+    return gpd.GeoDataFrame(
+        {
+            f"ADM{adm_level}_PCODE": [f"XX{i:04d}" for i in range(n)],
+            f"ADM{adm_level}_FR": fr,
+            f"ADM{adm_level}_EN": [f"Name {i}" for i in range(n)],
+        },
+        geometry=[Point(i % 100, i // 100) for i in range(n)],
+    )
+
+
+if __name__ == "__main__":
+    gdf = load_codabs(ADM_LEVEL)
+    source = "CODABs"
+    if gdf is None:
+        gdf = make_codabs(ADM_LEVEL, N_SYNTHETIC)
+        source = "synthetic boundaries"
+    if f"ADM{ADM_LEVEL}_FR" not in gdf.columns:
+        gdf[f"ADM{ADM_LEVEL}_FR"] = None
+
+    old = clean_gdf_apply(gdf.copy(), ADM_LEVEL)
+    new = clean_gdf(gdf.copy(), ADM_LEVEL)
+    # The old selection has no fallback past English, so only compare the
+    # areas it found a name for
+    named = old["name"].notna() & (old["name"] != "")
+    assert old.loc[named, "name"].equals(new.loc[named, "name"])
+
+    t_old = timeit.timeit(
+        lambda: clean_gdf_apply(gdf.copy(), ADM_LEVEL), number=N_RUNS
+    )
+    t_new = timeit.timeit(
+        lambda: clean_gdf(gdf.copy(), ADM_LEVEL), number=N_RUNS
+    )
+    print(
+        f"adm{ADM_LEVEL} from {source} ({len(gdf)} features): "
+        f"apply {t_old / N_RUNS * 1000:.2f} ms, "
+        f"vectorized {t_new / N_RUNS * 1000:.2f} ms"
+    )
@@ -0,0 +1,72 @@
+"""Compare the old DataFrame merge quantile join against the indexed join.
+
+Run from the repo root with:
+
+    python -m benchmarks.bench_quantile_join
+"""
+
+import random
+import timeit
+
+import pandas as pd
+
+from utils.geo_utils import get_boundaries, join_quantiles, load_boundaries
+
+ADM_LEVELS = ["0", "1", "region"]
+N_RUNS = 20
+
+
+def join_quantiles_merge(data, df_quantile):
+    """The join as previously done in set_adm_value."""
+    features_df = pd.DataFrame(
+        [feature["properties"] for feature in data["features"]]
+    )
+    df_joined = features_df.merge(
+        df_quantile[["pcode", "quantile"]], on="pcode", how="left"
+    )
+    for feature, quantile in zip(data["features"], df_joined["quantile"]):
+        feature["properties"]["quantile"] = quantile
+    return data
+
+
+def fake_quantiles(adm_level):
+    pcodes = [
+        feature["properties"]["pcode"]
+        for feature in load_boundaries(adm_level)["features"]
+    ]
+    return pd.DataFrame(
+        {
+            "pcode": pcodes,
+            "quantile": [random.randint(-2, 2) for _ in pcodes],
+        }
+    ).sample(frac=1)
+
+
+if __name__ == "__main__":
+    for adm_level in ADM_LEVELS:
+        df_quantile = fake_quantiles(adm_level)
+        n_features = len(load_boundaries(adm_level)["features"])
+
+        old = join_quantiles_merge(get_boundaries(adm_level), df_quantile)
+        new = join_quantiles(get_boundaries(adm_level), df_quantile, adm_level)
+        assert [f["properties"] for f in old["features"]] == [
+            f["properties"] for f in new["features"]
+        ]
+
+        t_old = timeit.timeit(
+            lambda: join_quantiles_merge(
+                get_boundaries(adm_level), df_quantile
+            ),
+            number=N_RUNS,
+        )
+        t_new = timeit.timeit(
+            lambda: join_quantiles(
+                get_boundaries(adm_level), df_quantile, adm_level
+            ),
+            number=N_RUNS,
+        )
+        print(
+            f"adm{adm_level} ({n_features} features): "
+            f"merge {t_old / N_RUNS * 1000:.2f} ms, "
+            f"indexed {t_new / N_RUNS * 1000:.2f} ms"
+        )
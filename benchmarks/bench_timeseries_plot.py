@@ -0,0 +1,82 @@
+"""Compare the size of the timeseries figure, and the time to build and
+serialize it, with a date per point against the compact figure, and with
+the data as JSON lists against binary arrays.
+
+Run from the repo root with:
+
+    python -m benchmarks.bench_timeseries_plot
+"""
+
+import math
+import timeit
+
+import numpy as np
+import pandas as pd
+from dash._utils import to_json
+
+from benchmarks.synthetic_data import make_exposure
+from utils import chart_utils
+from utils.data_utils import calculate_return_periods, process_flood_data
+
+N_RUNS = 10
+
+# (COMPACT_TIMESERIES, BINARY_FIGURES)
+CONFIGS = {
+    "dated, lists": (False, False),
+    "dated, binary": (False, True),
+    "compact, lists": (True, False),
+    "compact, binary": (True, True),
+}
+
+
+def build(df_seasonal, df_processed, peak_years, config):
+    chart_utils.COMPACT_TIMESERIES, chart_utils.BINARY_FIGURES = config
+    return chart_utils.create_timeseries_plot(
+        df_seasonal, df_processed, peak_years
+    )
+
+
+def get_points(fig):
+    """Get the (year, date, value) of each point drawn for the years, with
+    the values at the single precision that binary figures use."""
+    points = set()
+    for trace in fig.data[1:]:
+        dates = trace.x
+        if dates is None:
+            x0 = pd.Timestamp(trace.x0)
+            dates = [
+                x0 + pd.Timedelta(trace.dx * i, "ms")
+                for i in range(len(trace.y))
+            ]
+        for x, y in zip(dates, trace.y):
+            if y is None or math.isnan(y):
+                continue
+            date = pd.Timestamp(x, unit="ms" if np.isreal(x) else None)
+            points.add((int(trace.name), date, float(np.float32(y))))
+    return points
+
+
+if __name__ == "__main__":
+    df_exposure = make_exposure(["XX0000"], adm_level=1)
+    df_processed, df_seasonal, df_peaks = process_flood_data(df_exposure)
+    df_peaks, peak_years = calculate_return_periods(df_peaks)
+    args = (df_seasonal, df_processed, peak_years)
+
+    figs = {name: build(*args, config) for name, config in CONFIGS.items()}
+    points = get_points(figs["dated, lists"])
+    for fig in figs.values():
+        assert get_points(fig) == points
+
+    n_years = df_processed["date"].dt.year.nunique()
+    print(f"{n_years} years, {len(peak_years)} peak years:")
+    for name, config in CONFIGS.items():
+        fig = figs[name]
+        t_build = timeit.timeit(lambda: build(*args, config), number=N_RUNS)
+        # As done for the callback outputs
+        t_json = timeit.timeit(lambda: to_json(fig.to_dict()), number=N_RUNS)
+        print(
+            f"  {name}: {len(fig.data)} traces, "
+            f"{len(to_json(fig.to_dict())) / 1e3:.1f} kB JSON, "
+            f"built in {t_build / N_RUNS * 1000:.1f} ms, "
+            f"serialized in {t_json / N_RUNS * 1000:.1f} ms"
+        )
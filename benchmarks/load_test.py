@@ -0,0 +1,204 @@
+"""Replay realistic click traffic against the app and report the latency of
+each callback.
+
+Each simulated user picks an admin level, then selects a series of
+locations, each selection making the same callback requests as in the
+browser. Locations are picked with a long-tailed popularity, so a few are
+selected by many users, as happens when an area floods.
+
+Requests are made to the app in this process, or to a running server with
+`--url`. Either way, the app should use the stand-in database written by
+benchmarks/make_db.py. For example, from the repo root:
+
+    DB_URL=sqlite:///cache/bench/app.db python -m benchmarks.load_test
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Leave the caches cold, unless asked otherwise
+os.environ.setdefault("WARMUP", "false")
+
+from constants import MAP_FORMAT  # noqa: E402
+from utils.data_utils import get_quantile_classes  # noqa: E402
+from utils.geo_utils import get_boundary_path  # noqa: E402
+
+ADM_LEVEL_WEIGHTS = {"0": 1, "1": 6, "2": 3, "region": 1}
+# Exponent of the Zipf-like popularity of locations
+POPULARITY_SKEW = 1.1
+
+URL_PROP = (
+    ("boundary-url", "data")
+    if MAP_FORMAT == "topojson"
+    else ("geojson", "url")
+)
+CHART_OUTPUTS = [
+    ("exposure-chart", "children"),
+    ("rp-chart", "children"),
+    ("place-name", "children"),
+    ("num-exposed", "children"),
+    ("exposure-chart-title", "children"),
+    ("rp-chart-title", "children"),
+]
+
+
+def callback_body(outputs, inputs, state):
+    """Body of a Dash callback request, as sent by the browser."""
+    if len(outputs) == 1:
+        output = ".".join(outputs[0])
+    else:
+        output = "...".join(".".join(o) for o in outputs)
+        output = f"..{output}.."
+    outputs = [{"id": id_, "property": prop} for id_, prop in outputs]
+    return {
+        "output": output,
+        "outputs": outputs[0] if len(outputs) == 1 else outputs,
+        "inputs": [
+            {"id": id_, "property": prop, "value": value}
+            for id_, prop, value in inputs
+        ],
+        "state": [
+            {"id": id_, "property": prop, "value": value}
+            for id_, prop, value in state
+        ],
+        "changedPropIds": [f"{inputs[0][0]}.{inputs[0][1]}"],
+    }
+
+
+class Client:
+    """Posts callback requests, to the app in this process or to `url`."""
+
+    def __init__(self, url=None):
+        self.url = url
+        if url is None:
+            from app import server
+
+            self.test_client = server.test_client()
+
+    def post(self, body):
+        if self.url is None:
+            response = self.test_client.post(
+                "/_dash-update-component", json=body
+            )
+            assert response.status_code in (200, 204), response.status_code
+            return
+        request = urllib.request.Request(
+            f"{self.url}/_dash-update-component",
+            data=json.dumps(body).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request) as response:
+            response.read()
+
+
+def make_sessions(n_users, n_clicks, seed=0):
+    """Make the (adm_level, [selected locations]) of each user."""
+    rng = random.Random(seed)
+    # The map can only be shown for the levels with boundary files
+    adm_level_weights = {
+        adm_level: weight
+        for adm_level, weight in ADM_LEVEL_WEIGHTS.items()
+        if os.path.exists(get_boundary_path(adm_level))
+    }
+    locations = {}
+    for adm_level in adm_level_weights:
+        classes = list(get_quantile_classes(adm_level).items())
+        rng.shuffle(classes)
+        weights = [
+            1 / rank**POPULARITY_SKEW for rank in range(1, len(classes) + 1)
+        ]
+        locations[adm_level] = (classes, weights)
+
+    sessions = []
+    for _ in range(n_users):
+        adm_level = rng.choices(
+            list(adm_level_weights), list(adm_level_weights.values())
+        )[0]
+        classes, weights = locations[adm_level]
+        sessions.append((adm_level, rng.choices(classes, weights, k=n_clicks)))
+    return sessions
+
+
+def run_session(client, adm_level, selections, timings):
+    def timed(name, body):
+        start = time.perf_counter()
+        client.post(body)
+        timings[name].append(time.perf_counter() - start)
+
+    timed(
+        "set_adm_value",
+        callback_body(
+            [("geojson", "hideout"), ("map-title", "children")],
+            [("adm-level", "value", adm_level)],
+            [],
+        ),
+    )
+    timed(
+        "set_geojson_url",
+        callback_body(
+            [URL_PROP],
+            [("adm-level", "value", adm_level), ("map", "zoom", 3)],
+            [("map", "bounds", None), (*URL_PROP, None)],
+        ),
+    )
+    # Selecting a location on the map is done in the browser, which then
+    # only requests the charts
+    for pcode, quantile in selections:
+        properties = {"pcode": pcode, "quantile": quantile}
+        timed(
+            "update_plot",
+            callback_body(
+                CHART_OUTPUTS,
+                [("selected-data", "data", properties)],
+                [("adm-level", "value", adm_level)],
+            ),
+        )
+
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--clicks", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--url", help="URL of a running app to test")
+    args = parser.parse_args()
+
+    sessions = make_sessions(args.users, args.clicks)
+    client = Client(args.url)
+    timings = defaultdict(list)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        futures = [
+            executor.submit(
+                run_session, client, adm_level, selections, timings
+            )
+            for adm_level, selections in sessions
+        ]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    n_requests = sum(len(times) for times in timings.values())
+    print(
+        f"{args.users} users x {args.clicks} clicks, {args.concurrency} at a "
+        f"time: {n_requests} requests in {elapsed:.1f}s "
+        f"({n_requests / elapsed:.1f}/s)"
+    )
+    for name, times in timings.items():
+        print(
+            f"  {name:<16} n={len(times):<5} "
+            f"p50 {percentile(times, 50) * 1000:8.1f} ms, "
+            f"p95 {percentile(times, 95) * 1000:8.1f} ms, "
+            f"max {max(times) * 1000:8.1f} ms"
+        )
@@ -0,0 +1,163 @@
+"""Write a SQLite stand-in for the app's database, with synthetic data at
+about the scale of the real one, for load tests and benchmarks.
+
+All countries' admin 0, 1 and region boundaries are taken from assets/geo.
+Admin 2 areas are made up, `ADM2_PER_ADM1` in each admin 1 area by default.
+Each area gets daily exposure over the last `--years` years, its current
+quantile, and its names in the admin lookup.
+
+Run from the repo root with:
+
+    python -m benchmarks.make_db --path cache/bench/app.db
+
+then point the app at it with `DB_URL=sqlite:///cache/bench/app.db`.
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+from benchmarks.synthetic_data import make_exposure
+from utils.geo_utils import get_boundary_path
+
+ADM2_PER_ADM1 = 8
+N_YEARS = 25
+
+
+def load_areas(adm_level):
+    with open(get_boundary_path(adm_level)) as file:
+        features = json.load(file)["features"]
+    return pd.DataFrame([feature["properties"] for feature in features])
+
+
+def make_admin_lookup(adm2_per_adm1):
+    df_adm0 = load_areas("0").rename(
+        columns={"pcode": "adm0_pcode", "name": "adm0_name"}
+    )
+    df_adm1 = load_areas("1").rename(
+        columns={"pcode": "adm1_pcode", "name": "adm1_name"}
+    )
+    df_adm1["adm0_pcode"] = df_adm1["adm1_pcode"].str[:2]
+    df_adm2 = df_adm1.loc[df_adm1.index.repeat(adm2_per_adm1)].copy()
+    n = df_adm2.groupby("adm1_pcode").cumcount() + 1
+    df_adm2["adm2_pcode"] = df_adm2["adm1_pcode"] + n.map("{:03d}".format)
+    df_adm2["adm2_name"] = df_adm2["adm1_name"] + " " + n.astype(str)
+    df_lookup = df_adm2.merge(df_adm0, on="adm0_pcode", how="left")
+
+    df_region = load_areas("region").rename(
+        columns={"pcode": "admregion_pcode", "name": "admregion_name"}
+    )
+    df_region["adm0_pcode"] = "CD"
+    df_region = df_region.merge(df_adm0, on="adm0_pcode", how="left")
+    return pd.concat([df_lookup, df_region], ignore_index=True)
+
+
+def get_pcodes(df_lookup, adm_level, adm0_pcode):
+    col = f"adm{adm_level}_pcode"
+    df = df_lookup[df_lookup["adm0_pcode"] == adm0_pcode]
+    return df[col].dropna().drop_duplicates().tolist()
+
+
+def write_exposure(con, df_lookup, start_date, end_date):
+    for i, adm0_pcode in enumerate(df_lookup["adm0_pcode"].unique()):
+        start = time.time()
+        n_rows = 0
+        for adm_level in ["0", "1", "2", "region"]:
+            pcodes = get_pcodes(df_lookup, adm_level, adm0_pcode)
+            if not pcodes:
+                continue
+            df = make_exposure(
+                pcodes,
+                adm_level,
+                end_date=end_date,
+                seed=i,
+                start_date=start_date,
+            ).drop(columns=f"adm{adm_level}_pcode")
+            table = (
+                "floodscan_exposure_regions"
+                if adm_level == "region"
+                else "floodscan_exposure"
+            )
+            df.to_sql(
+                table,
+                con,
+                schema="app",
+                index=False,
+                if_exists="append",
+                dtype={"valid_date": sa.Date},
+                chunksize=100_000,
+            )
+            n_rows += len(df)
+        print(f"  {adm0_pcode}: {n_rows:,} rows in {time.time() - start:.0f}s")
+
+
+def make_quantiles(df_lookup, end_date):
+    rng = np.random.default_rng(0)
+    dfs = []
+    for adm_level in ["0", "1", "2", "region"]:
+        pcodes = df_lookup[f"adm{adm_level}_pcode"].dropna().unique()
+        dfs.append(
+            pd.DataFrame(
+                {
+                    "pcode": pcodes,
+                    "adm_level": adm_level,
+                    "valid_date": end_date.date(),
+                    "quantile": rng.integers(-2, 3, len(pcodes)),
+                }
+            )
+        )
+    return dfs[:-1], dfs[-1]
+
+
+def main(path, years, adm2_per_adm1):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if os.path.exists(path):
+        os.remove(path)
+    engine = sa.create_engine(f"sqlite:///{path}")
+
+    @sa.event.listens_for(engine, "connect")
+    def attach(dbapi_connection, _):
+        dbapi_connection.execute(f"ATTACH DATABASE '{path}' AS app")
+
+    end_date = pd.Timestamp.today().normalize() - pd.Timedelta(days=1)
+    start_date = pd.Timestamp(year=end_date.year - years + 1, month=1, day=1)
+    df_lookup = make_admin_lookup(adm2_per_adm1)
+    print(f"Writing {path}, from {start_date:%Y-%m-%d} to {end_date:%Y-%m-%d}")
+    with engine.begin() as con:
+        df_lookup.to_sql("admin_lookup", con, schema="app", index=False)
+        dfs_quantile, df_quantile_regions = make_quantiles(df_lookup, end_date)
+        for table, df in [
+            ("quantile", pd.concat(dfs_quantile)),
+            ("quantile_regions", df_quantile_regions),
+        ]:
+            df.to_sql(
+                table,
+                con,
+                schema="app",
+                index=False,
+                dtype={"valid_date": sa.Date},
+            )
+        write_exposure(con, df_lookup, start_date, end_date)
+        for table in ["floodscan_exposure", "floodscan_exposure_regions"]:
+            # As the pcode lookups are indexed in the real database
+            con.execute(
+                sa.text(
+                    f"CREATE INDEX app.ix_{table}_pcode "
+                    f"ON {table} (pcode, adm_level)"
+                )
+            )
+    print(f"Done, {os.path.getsize(path) / 1e9:.1f} GB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--path", default="cache/bench/app.db")
+    parser.add_argument("--years", type=int, default=N_YEARS)
+    parser.add_argument("--adm2-per-adm1", type=int, default=ADM2_PER_ADM1)
+    args = parser.parse_args()
+    main(args.path, args.years, args.adm2_per_adm1)
@@ -1,158 +1,155 @@
-import json
+from urllib.parse import urlencode
 
-import dash_leaflet as dl
-import dash_leaflet.express as dlx
 import dash_mantine_components as dmc
-import pandas as pd
-from dash import Input, Output, State, dcc, html, no_update
-from dash_extensions.javascript import arrow_function, assign
-
-from constants import ATTRIBUTION, URL, URL_LABELS
-from utils.chart_utils import create_return_period_plot, create_timeseries_plot
-from utils.data_utils import (
-    calculate_return_periods,
-    fetch_flood_data,
-    get_current_quantiles,
-    get_summary,
-    process_flood_data,
+from dash import (
+    ClientsideFunction,
+    Input,
+    Output,
+    Patch,
+    State,
+    dcc,
+    html,
+    no_update,
+)
+
+from constants import (
+    BACKGROUND_CALLBACKS,
+    CLIENTSIDE_CHARTS,
+    GEO_SHARDED,
+    MAP_FORMAT,
+)
+from utils.data_utils import get_current_quantiles, get_quantile_classes
+from utils.geo_utils import (
+    bounds_to_rect,
+    get_file_version,
+    get_flatgeobuf_path,
+    get_joined_version,
+    get_lod,
+    get_shard_index,
+    get_shards_in_view,
+    get_topojson_version,
 )
 from utils.log_utils import get_logger
+from utils.metrics_utils import span
+from utils.pipeline_utils import get_plot_outputs
+from utils.warmup_utils import record_selection
 
 logger = get_logger("callbacks")
 
-style_handle = assign(
-    """
-    function(feature, context) {
-        const {colorscale, style, colorProp, selected} = context.hideout;  // get props from hideout
-        const value = feature.properties[colorProp];  // get value that determines the color
-        let featureStyle = {...style};
-
-        // Only modify opacity if this feature's pcode matches selected
-        if (selected === feature.properties.pcode) {
-            featureStyle.fillOpacity = 1;
-            featureStyle.color = "black";
-            featureStyle.weight = 1;
-        }
-
-        // Set color based on value
-        if (value === -2) {
-            featureStyle.fillColor = colorscale[0];
-        } else if (value === -1) {
-            featureStyle.fillColor = colorscale[1];
-        } else if (value === 0) {
-            featureStyle.fillColor = colorscale[2];
-        } else if (value === 1) {
-            featureStyle.fillColor = colorscale[3];
-        } else if (value === 2) {
-            featureStyle.fillColor = colorscale[4];
-        }
-
-        return featureStyle;
-    }
-"""
-)
-
 
 def register_callbacks(app):
-    @app.callback(
+    def get_boundary_url(adm_level, zoom, bounds):
+        # Boundaries simplified to suit the zoom, see `GEO_LODS`
+        iso3s = None
+        if MAP_FORMAT == "geojson" and GEO_SHARDED:
+            iso3s = get_shards_in_view(bounds)
+        if iso3s is not None:
+            lod = get_lod(adm_level, zoom)
+            path = f"/geo/adm{adm_level}.json"
+            params = {
+                "v": get_joined_version(adm_level, lod),
+                "iso3": ",".join(iso3s),
+            }
+        elif MAP_FORMAT == "flatgeobuf":
+            lod = get_lod(adm_level, zoom, "fgb")
+            path = f"/geo/adm{adm_level}.fgb"
+            params = {
+                "v": get_file_version(get_flatgeobuf_path(adm_level, lod))
+            }
+        elif MAP_FORMAT == "topojson":
+            lod = get_lod(adm_level, zoom, "topojson")
+            path = f"/geo/adm{adm_level}.topojson"
+            params = {"v": get_topojson_version(adm_level, lod)}
+        else:
+            lod = get_lod(adm_level, zoom)
+            path = f"/geo/adm{adm_level}.json"
+            params = {"v": get_joined_version(adm_level, lod)}
+        if lod is not None:
+            params["lod"] = lod
+        return app.get_relative_path(f"{path}?{urlencode(params)}")
+
+    # Runs in the browser, see assets/selection.js
+    app.clientside_callback(
+        ClientsideFunction(namespace="map", function_name="toggle_select"),
         Output("selected-data", "data"),
-        Output("geojson", "hideout"),
+        Output("geojson", "hideout", allow_duplicate=True),
         Input("geojson", "n_clicks"),
-        State("adm-level", "value"),
         State("geojson", "clickData"),
         State("geojson", "hideout"),
         prevent_initial_call=True,
     )
-    def toggle_select(_, adm_level, feature, hideout):
-        if not _:
-            return no_update
-        if not feature:
-            return no_update
 
-        name = feature["properties"]["pcode"]
-        if hideout["selected"] == name:
-            hideout["selected"] = ""
-        else:
-            hideout["selected"] = name
-        return feature["properties"], hideout
-
-    @app.callback(Output("map", "children"), Input("adm-level", "value"))
+    @app.callback(
+        Output("geojson", "hideout"),
+        Output("map-title", "children"),
+        Input("adm-level", "value"),
+    )
+    @span("set_adm_value")
     def set_adm_value(adm_level):
-        with open(f"assets/geo/adm{adm_level}.json", "r") as file:
-            data = json.load(file)
+        with span("get_current_quantiles"):
+            df_quantile = get_current_quantiles(adm_level)
 
-        df_quantile = get_current_quantiles(adm_level)
-        features_df = pd.DataFrame(
-            [feature["properties"] for feature in data["features"]]
-        )
-        df_joined = features_df.merge(
-            df_quantile[["pcode", "quantile"]], on="pcode", how="left"
-        )
-        for feature, quantile in zip(data["features"], df_joined["quantile"]):
-            feature["properties"]["quantile"] = quantile
-
-        colorscale = ["#fafafa", "#e0e0e0", "#b8b8b8", "#f7a29c", "#da5a51"]
-        colorbar = dlx.categorical_colorbar(
-            categories=[
-                "Well below<br>normal",
-                "Below normal",
-                "Normal",
-                "Above normal",
-                "Well above<br>normal",
-            ],
-            colorscale=colorscale,
-            width=300,
-            height=15,
-            position="bottomleft",
-        )
-        title = html.Div(
-            f"Exposed population on {df_quantile.valid_date.max():%b %d} is...",  # noqa
-            style={
-                "position": "absolute",
-                "bottom": "60px",
-                "left": "10px",
-                "zIndex": 1000,
-                "fontSize": "12px",
-                "paddingBottom": "5px",
-                "fontWeight": "bold",
-            },
-        )
+        # The rest of the map stays in place (see map_layers in
+        # layouts/content.py), so only the changed keys of the hideout are
+        # sent
+        hideout = Patch()
+        hideout["selected"] = ""
+        if MAP_FORMAT in ("flatgeobuf", "topojson"):
+            # These boundaries don't have the quantiles joined on, so they
+            # are joined on in the browser, from a mapping of pcode to class
+            with span("get_quantile_classes"):
+                hideout["quantiles"] = get_quantile_classes(adm_level)
+        title = f"Exposed population on {df_quantile.valid_date.max():%b %d} is..."  # noqa
+        return hideout, title
 
-        style = dict(weight=1, opacity=1, color="white", fillOpacity=0.75)
-
-        geojson = dl.GeoJSON(
-            data=data,
-            id="geojson",
-            style=style_handle,
-            hideout=dict(
-                colorscale=colorscale,
-                style=style,
-                colorProp="quantile",
-                selected="",
-            ),
-            hoverStyle=arrow_function(
-                {"fillOpacity": 1, "weight": 1, "color": "black"}
+    url_prop = (
+        ("boundary-url", "data")
+        if MAP_FORMAT == "topojson"
+        else ("geojson", "url")
+    )
+
+    @app.callback(
+        Output(*url_prop),
+        Input("adm-level", "value"),
+        Input("map", "zoom"),
+        # Panning only changes which shards are in view
+        (Input if GEO_SHARDED else State)("map", "bounds"),
+        State(*url_prop),
+    )
+    @span("set_geojson_url")
+    def set_geojson_url(adm_level, zoom, bounds, url):
+        if (
+            MAP_FORMAT == "geojson"
+            and GEO_SHARDED
+            and not bounds
+            and get_shard_index() is not None
+        ):
+            # Wait for the map to report the bounds, rather than loading all
+            # countries and then the shards in view
+            return no_update
+        # The browser caches the boundaries by URL, so they are only
+        # downloaded again when the URL changes
+        new_url = get_boundary_url(adm_level, zoom, bounds)
+        return no_update if new_url == url else new_url
+
+    if MAP_FORMAT == "topojson":
+        app.clientside_callback(
+            ClientsideFunction(
+                namespace="boundaries", function_name="load_topojson"
             ),
-            zoomToBounds=False,
-        )
-        adm0 = dl.GeoJSON(
-            url="assets/geo/adm0_outline.json",
-            id="adm0-geojson",
-            style={"color": "#353535", "weight": 1.5},
+            Output("geojson", "data"),
+            Input("boundary-url", "data"),
         )
 
-        return [
-            dl.TileLayer(url=URL, attribution=ATTRIBUTION),
-            dl.Pane(adm0, style={"zIndex": 1001}, name="adm0"),
-            dl.Pane(geojson, style={"zIndex": 1000}, name="sel"),
-            dl.Pane(
-                dl.TileLayer(url=URL_LABELS, attribution=ATTRIBUTION),
-                name="tile",
-                style={"zIndex": 1002},
-            ),
-            title,
-            colorbar,
-        ]
+    if MAP_FORMAT == "flatgeobuf":
+
+        @app.callback(
+            Output("geojson", "formatOptions"),
+            Input("map", "bounds"),
+            prevent_initial_call=True,
+        )
+        def set_geojson_rect(bounds):
+            return {"rect": bounds_to_rect(bounds)}
 
     @app.callback(
         Output("exposure-chart", "children"),
@@ -164,7 +161,11 @@ def register_callbacks(app):
         Input("selected-data", "data"),
         State("adm-level", "value"),
         prevent_initial_call=False,
+        # Selecting another location while the charts are being built
+        # cancels the job building them
+        background=BACKGROUND_CALLBACKS,
     )
+    @span("update_plot")
     def update_plot(selected_data, adm_level):
         exposed_plot_title = "Daily population exposed to flooding"
         rp_plot_title = (
@@ -193,9 +194,10 @@ def register_callbacks(app):
         pcode = selected_data["pcode"]
         quantile = selected_data["quantile"]
 
-        df_exposure, df_adm = fetch_flood_data(pcode, adm_level)
+        record_selection(pcode, adm_level)
+        outputs = get_plot_outputs(pcode, adm_level, quantile)
 
-        if len(df_exposure) == 0:
+        if outputs is None:
             logger.warning(f"No data available for {pcode}")
             empty_children = [
                 dmc.Space(h=100),
@@ -212,23 +214,26 @@ def register_callbacks(app):
                 no_update,
             )
 
-        # Process data
-        df_processed, df_seasonal, df_peaks = process_flood_data(df_exposure)
-        df_peaks, peak_years = calculate_return_periods(df_peaks)
-
-        # Create plots
-        fig_timeseries = create_timeseries_plot(
-            df_seasonal, df_processed, peak_years
-        )
-        fig_rp = create_return_period_plot(df_peaks)
-
-        exposure_chart = dcc.Graph(
-            config={"displayModeBar": False}, figure=fig_timeseries
-        )
-        rp_chart = dcc.Graph(config={"displayModeBar": False}, figure=fig_rp)
-        name, exposed_summary = get_summary(
-            df_processed, df_adm, adm_level, quantile
-        )
+        if CLIENTSIDE_CHARTS:
+            # The figures are drawn from the chart data by draw_charts
+            exposure_chart = [
+                dcc.Graph(
+                    id="exposure-graph", config={"displayModeBar": False}
+                ),
+                dcc.Store(id="chart-data", data=outputs["chart_data"]),
+            ]
+            rp_chart = dcc.Graph(
+                id="rp-graph", config={"displayModeBar": False}
+            )
+        else:
+            exposure_chart = dcc.Graph(
+                config={"displayModeBar": False},
+                figure=outputs["fig_timeseries"],
+            )
+            rp_chart = dcc.Graph(
+                config={"displayModeBar": False}, figure=outputs["fig_rp"]
+            )
+        name, exposed_summary = outputs["name"], outputs["summary"]
         return (
             exposure_chart,
             rp_chart,
@@ -238,6 +243,18 @@ def register_callbacks(app):
             f"{rp_plot_title}: {name}",
         )
 
+    if CLIENTSIDE_CHARTS:
+        # See assets/charts.js
+        app.clientside_callback(
+            ClientsideFunction(
+                namespace="charts", function_name="draw_charts"
+            ),
+            Output("exposure-graph", "figure"),
+            Output("rp-graph", "figure"),
+            Input("chart-data", "data"),
+            State("chart-styles", "data"),
+        )
+
     @app.callback(
         Output("hover-place-name", "children"), Input("geojson", "hoverData")
     )
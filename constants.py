@@ -23,9 +23,122 @@ ISO3S = [
     "sdn",
 ]
 ADM_LEVELS = [0, 1, 2]
+# Languages to take the admin names from, in order of preference. Names
+# missing in one language fall back to the next.
+NAME_LANGUAGES = ["FR", "EN", "PT"]
 
 ROLLING_WINDOW = int(os.getenv("ROLL_WINDOW", 7))
 
+# Whether to give the daily series of the timeseries chart by their first date
+# and a one-day step rather than a date per point, which makes the figure much
+# smaller
+COMPACT_TIMESERIES = os.getenv("COMPACT_TIMESERIES", "true").lower() == "true"
+# Whether to send chart data as binary typed arrays rather than JSON lists.
+# Turn off for clients with a Plotly.js that can't read them (before 2.28).
+BINARY_FIGURES = os.getenv("BINARY_FIGURES", "true").lower() == "true"
+# Whether to send only the series of the charts, for them to be drawn in the
+# browser, rather than the whole figures
+CLIENTSIDE_CHARTS = os.getenv("CLIENTSIDE_CHARTS", "false").lower() == "true"
+
+# Database to use instead of the one for STAGE, e.g. the local SQLite
+# stand-in written by benchmarks/make_db.py
+DB_URL = os.getenv("DB_URL")
+
+# Database connection pool, per worker process
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 5))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 30 * 60))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+# Connection checkouts slower than this many seconds are logged as warnings
+DB_SLOW_CHECKOUT = float(os.getenv("DB_SLOW_CHECKOUT", 0.5))
+
+# Optionally load the exposure tables into memory in bulk, rather than
+# querying the database for each selected pcode
+EXPOSURE_PRELOAD = os.getenv("EXPOSURE_PRELOAD", "false").lower() == "true"
+EXPOSURE_PRELOAD_MAX_MB = int(os.getenv("EXPOSURE_PRELOAD_MAX_MB", 1024))
+EXPOSURE_PRELOAD_TTL = int(os.getenv("EXPOSURE_PRELOAD_TTL", 24 * 60 * 60))
+EXPOSURE_PRELOAD_CHUNKSIZE = 100_000
+
+# Optionally keep the processed exposure data of each selected location on
+# disk, and only query the database for the days published since
+EXPOSURE_HISTORY = os.getenv("EXPOSURE_HISTORY", "false").lower() == "true"
+EXPOSURE_HISTORY_DIR = os.getenv("EXPOSURE_HISTORY_DIR", "cache/exposure")
+# Seconds after which a location's whole history is fetched again, to pick up
+# any revisions of past days
+EXPOSURE_HISTORY_MAX_AGE = int(
+    os.getenv("EXPOSURE_HISTORY_MAX_AGE", 7 * 24 * 60 * 60)
+)
+
+# Levels of detail of the boundaries, by the map zoom they are used from.
+# "tolerance" is the Douglas-Peucker distance in degrees, roughly half a pixel
+# at the minimum zoom. Boundaries that form a valid coverage are simplified
+# with shapely.coverage_simplify instead, whose "coverage_tolerance" is the
+# square root of the area removed (Visvalingam-Whyatt). Twice the distance
+# keeps about as many vertices (within 30%), as measured on the admin 1 and
+# region boundaries.
+GEO_LODS = [
+    {"min_zoom": 0, "tolerance": 0.05, "coverage_tolerance": 0.1},
+    {"min_zoom": 5, "tolerance": 0.01, "coverage_tolerance": 0.02},
+    {"min_zoom": 7, "tolerance": 0.002, "coverage_tolerance": 0.004},
+]
+# Douglas-Peucker tolerance for the default boundary files of the admin
+# levels, as used when there is no zoom
+GEO_TOLERANCE = 0.005
+
+# How boundaries are sent to the map: "geojson" for whole files with the
+# quantiles joined on, "flatgeobuf" to read only the features in view from
+# spatially indexed files, or "topojson" for whole files with the shared
+# borders stored once and quantized coordinates
+MAP_FORMAT = os.getenv("MAP_FORMAT", "geojson")
+# Whether the map loads the boundaries of only the countries in view, from
+# per-country shards, rather than all countries at once. Only used with the
+# "geojson" format.
+GEO_SHARDED = os.getenv("GEO_SHARDED", "false").lower() == "true"
+# Grid size that TopoJSON coordinates are quantized to, along each axis of
+# the bounding box of the boundaries
+GEO_QUANTIZATION = 100_000
+
+# Boundaries with the quantiles joined on, as served to the map
+GEO_CACHE_DIR = os.getenv("GEO_CACHE_DIR", "cache/geo")
+GEO_MAX_AGE = int(os.getenv("GEO_MAX_AGE", 24 * 60 * 60))
+
+# Output of precompute_stats.py, read by the app when it is up to date
+STATS_DIR = os.getenv("STATS_DIR", "cache/stats")
+
+ADMIN_LOOKUP_TTL = int(os.getenv("ADMIN_LOOKUP_TTL", 24 * 60 * 60))
+
+# How often to check the database for newly published data
+DATA_VERSION_TTL = int(os.getenv("DATA_VERSION_TTL", 5 * 60))
+
+# Cache of the processed chart outputs for each selected location. The
+# "filesystem" backend is shared by all workers on the same machine.
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "memory")
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "cache/results")
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 256))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", 24 * 60 * 60))
+
+# Whether to build the charts in background processes, so that web workers
+# aren't blocked while they are built. Each build is a new process, without
+# the worker's connection pool and in-memory caches (see the README).
+BACKGROUND_CALLBACKS = (
+    os.getenv("BACKGROUND_CALLBACKS", "false").lower() == "true"
+)
+BACKGROUND_CACHE_DIR = os.getenv("BACKGROUND_CACHE_DIR", "cache/background")
+
+# Warm up the caches when a worker starts and when new data is published,
+# with the charts of the locations listed as "adm_level:pcode" in
+# WARMUP_PCODES and of the most selected locations
+WARMUP = os.getenv("WARMUP", "true").lower() == "true"
+WARMUP_PCODES = os.getenv("WARMUP_PCODES", "")
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", 20))
+# Selected locations, shared by all workers, to rank them by popularity
+SELECTION_LOG = os.getenv("SELECTION_LOG", "cache/selections.log")
+SELECTION_LOG_MAX_LINES = 10_000
+# How many selections each worker appends between checks that the log needs
+# trimming back to the latest SELECTION_LOG_MAX_LINES
+SELECTION_LOG_TRIM_EVERY = 1_000
+
 iso3_to_pcode = {
     "ner": "NE",
     "nga": "NG",
@@ -100,3 +213,7 @@ URL_LABELS = "https://{s}.basemaps.cartocdn.com/rastertiles/voyager_only_labels/
 CUR_YEAR = datetime.today().year
 
 STAGE = os.getenv("STAGE")
+
+# Local copies of the CODABs, and the boundaries processed from them, used by
+# download_geodata.py to skip countries that haven't changed
+CODAB_CACHE_DIR = os.getenv("CODAB_CACHE_DIR", "cache/codab")
@@ -1,69 +1,302 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import geopandas as gpd
 import pandas as pd
+import shapely
+import topojson
 
-from constants import ADM_LEVELS, ISO3S, REGIONS
+from constants import (
+    ADM_LEVELS,
+    CODAB_CACHE_DIR,
+    GEO_LODS,
+    GEO_QUANTIZATION,
+    GEO_TOLERANCE,
+    ISO3S,
+    NAME_LANGUAGES,
+    REGIONS,
+)
 from utils import codab_utils
 
 
+def get_names(gdf, adm_level):
+    """Get the name of each admin area in the first language of
+    `NAME_LANGUAGES` that it has a name in, or an empty string if none."""
+    names = pd.Series("", index=gdf.index, dtype=object)
+    for language in reversed(NAME_LANGUAGES):
+        column = f"ADM{adm_level}_{language}"
+        if column in gdf.columns:
+            values = gdf[column]
+            names = values.where(values.notna() & (values != ""), names)
+    return names
+
+
 def clean_gdf(gdf, adm_level):
-    gdf["name"] = gdf.apply(
-        lambda row: (
-            row[f"ADM{adm_level}_FR"]
-            if pd.notna(row.get(f"ADM{adm_level}_FR"))
-            and row.get(f"ADM{adm_level}_FR") != ""
-            else row.get(f"ADM{adm_level}_EN", "")
-        ),
-        axis=1,
-    )
+    gdf["name"] = get_names(gdf, adm_level)
     gdf.rename(columns={f"ADM{adm_level}_PCODE": "pcode"}, inplace=True)
     gdf = gdf[["pcode", "name", "geometry"]]
     return gdf
 
 
+def write_flatgeobuf(gdf, path):
+    """Write boundaries as FlatGeobuf with a spatial index, for the map to
+    read only the features in view."""
+    gdf.to_file(path, driver="FlatGeobuf", SPATIAL_INDEX="YES")
+
+
+def to_topojson(gdf):
+    """Encode boundaries as TopoJSON, with the borders shared by neighbouring
+    polygons stored once and coordinates quantized."""
+    topology = topojson.Topology(
+        gdf,
+        topology=True,
+        prequantize=GEO_QUANTIZATION,
+        object_name="boundaries",
+    )
+    return topology.to_json()
+
+
+def write_topojson(gdf, path):
+    with open(path, "w") as file:
+        file.write(to_topojson(gdf))
+
+
+def simplify_gdf(gdf, tolerance, coverage_tolerance=None):
+    """Simplify each polygon separately, to within `tolerance` degrees
+    (Douglas-Peucker).
+
+    With `coverage_tolerance`, boundaries that form a valid coverage (no
+    overlaps or gaps between neighbours) are instead simplified together
+    with `shapely.coverage_simplify`, which keeps shared edges identical so
+    that no gaps open up between them. Its tolerance is the square root of
+    the area of the triangles removed (Visvalingam-Whyatt), see `GEO_LODS`.
+    """
+    gdf = gdf.copy()
+    if coverage_tolerance is not None:
+        if shapely.coverage_is_valid(gdf.geometry.values):
+            gdf["geometry"] = shapely.coverage_simplify(
+                gdf.geometry.values, tolerance=coverage_tolerance
+            )
+            return gdf
+        print("Not a valid coverage, simplifying each polygon separately")
+    gdf["geometry"] = gdf.geometry.simplify(tolerance=tolerance)
+    return gdf
+
+
+def write_shards(gdf, iso3s, name):
+    """Write boundaries split up by country, from the ISO3s in `iso3s`."""
+    os.makedirs("assets/geo/shards", exist_ok=True)
+    for iso3, gdf_shard in gdf.groupby(iso3s):
+        gdf_shard.to_file(
+            f"assets/geo/shards/{name}_{iso3}.json", driver="GeoJSON"
+        )
+
+
+def write_boundaries(gdf, name, tolerance=GEO_TOLERANCE):
+    """Write boundaries at the default and at each zoom's level of detail,
+    and split up by country (from the `iso3` column) at each.
+
+    The default boundaries are simplified to `tolerance`, or not at all if
+    it is `None`.
+    """
+    iso3s = gdf["iso3"]
+    gdf = gdf.drop(columns="iso3")
+    gdf_simplified = gdf
+    if tolerance is not None:
+        gdf_simplified = simplify_gdf(gdf, tolerance)
+    write_shards(gdf_simplified, iso3s, name)
+    gdf_simplified.to_file(f"assets/geo/{name}.json", driver="GeoJSON")
+    write_flatgeobuf(gdf_simplified, f"assets/geo/{name}.fgb")
+    write_topojson(gdf_simplified, f"assets/geo/{name}.topojson")
+    write_lods(gdf, name, iso3s)
+
+
+def write_lods(gdf, name, iso3s=None, min_tolerance=0):
+    """Write boundaries at each zoom's level of detail, skipping those with a
+    tolerance below `min_tolerance`, and split up by country if `iso3s` is
+    given."""
+    for lod, params in enumerate(GEO_LODS):
+        if params["tolerance"] < min_tolerance:
+            print(f"Skipping {name} level of detail {lod}")
+            continue
+        gdf_lod = simplify_gdf(
+            gdf, params["tolerance"], params["coverage_tolerance"]
+        )
+        if iso3s is not None:
+            write_shards(gdf_lod, iso3s, f"{name}_lod{lod}")
+        gdf_lod.to_file(f"assets/geo/{name}_lod{lod}.json", driver="GeoJSON")
+        write_flatgeobuf(gdf_lod, f"assets/geo/{name}_lod{lod}.fgb")
+        write_topojson(gdf_lod, f"assets/geo/{name}_lod{lod}.topojson")
+
+
+def get_shard_iso3s(gdf, name):
+    """Get the ISO3 of each feature of the default boundaries, from the
+    shards they were split into, or `None` if there are no shards."""
+    iso3s = {}
+    for iso3 in ISO3S:
+        path = f"assets/geo/shards/{name}_{iso3}.json"
+        if os.path.exists(path):
+            for pcode in gpd.read_file(path)["pcode"]:
+                iso3s[pcode] = iso3
+    if not iso3s:
+        return None
+    return gdf["pcode"].map(iso3s)
+
+
+def write_lods_from_assets():
+    """Write the levels of detail from the default boundaries already in
+    assets/geo, without downloading the CODABs.
+
+    The default boundaries are simplified to `GEO_TOLERANCE`, so only the
+    coarser levels of detail are written. The map uses the default
+    boundaries in place of the others.
+    """
+    for name in [f"adm{adm_level}" for adm_level in ADM_LEVELS] + [
+        "admregion"
+    ]:
+        path = f"assets/geo/{name}.json"
+        if not os.path.exists(path):
+            continue
+        gdf = gpd.read_file(path)
+        write_lods(
+            gdf,
+            name,
+            get_shard_iso3s(gdf, name),
+            min_tolerance=GEO_TOLERANCE,
+        )
+
+
+def write_shard_index(gdf):
+    """Write the bounding box of each country, for the map to work out which
+    countries' shards are in view."""
+    bounds = {
+        iso3: [float(x) for x in gdf_iso3.total_bounds]
+        for iso3, gdf_iso3 in gdf.groupby("iso3")
+    }
+    os.makedirs("assets/geo/shards", exist_ok=True)
+    with open("assets/geo/shards/index.json", "w") as file:
+        json.dump(bounds, file)
+
+
+def get_country_path(iso3, adm_level):
+    return os.path.join(CODAB_CACHE_DIR, f"{iso3}_adm{adm_level}.parquet")
+
+
+def prepare_country(iso3):
+    """Download the CODAB for a country and write its cleaned boundaries for
+    each admin level to `CODAB_CACHE_DIR`.
+
+    Countries whose CODAB hasn't changed since the last run are skipped.
+    Returns the ETag of the CODAB and whether the boundaries were rebuilt.
+    """
+    etag = codab_utils.download_codab(iso3)
+    etag_path = os.path.join(CODAB_CACHE_DIR, f"{iso3}_boundaries.etag")
+    paths = [get_country_path(iso3, adm_level) for adm_level in ADM_LEVELS]
+    if os.path.exists(etag_path) and all(map(os.path.exists, paths)):
+        with open(etag_path) as file:
+            if file.read() == etag:
+                return etag, False
+
+    for adm_level, path in zip(ADM_LEVELS, paths):
+        gdf = codab_utils.load_codab(iso3, admin_level=adm_level)
+        if (iso3 in ["nga", "tcd"]) and (adm_level == 0):
+            gdf = gdf.dissolve()
+        gdf = clean_gdf(gdf, adm_level)
+        gdf.to_parquet(path)
+    with open(etag_path, "w") as file:
+        file.write(etag)
+    return etag, True
+
+
+def load_manifest():
+    """Get the CODAB ETag of each country as of the last complete build."""
+    path = os.path.join(CODAB_CACHE_DIR, "manifest.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_manifest(etags):
+    with open(os.path.join(CODAB_CACHE_DIR, "manifest.json"), "w") as file:
+        json.dump(etags, file)
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--lods-only",
+        action="store_true",
+        help="Only write the levels of detail, from the boundaries in "
+        "assets/geo",
+    )
+    args = parser.parse_args()
+    if args.lods_only:
+        write_lods_from_assets()
+        raise SystemExit
+
+    # Each country's CODAB is downloaded and split into admin levels once,
+    # in parallel, and only if it has changed since the last run
+    print("Preparing CODABs...")
+    etags = {}
+    with ProcessPoolExecutor() as executor:
+        for iso3, (etag, rebuilt) in zip(
+            ISO3S, executor.map(prepare_country, ISO3S)
+        ):
+            print(f"{iso3}: {'updated' if rebuilt else 'unchanged'}")
+            etags[iso3] = etag
+    if etags == load_manifest():
+        print("No CODABs have changed, nothing to do.")
+        raise SystemExit
+
     region_gdfs = []
     for adm_level in ADM_LEVELS:
         print(f"Processing geo data for admin {adm_level}...")
-        gdfs = []
-        for iso3 in ISO3S:
-            gdf = codab_utils.load_codab_from_blob(iso3, admin_level=adm_level)
-            if (iso3 in ["nga", "tcd"]) and (adm_level == 0):
-                gdf = gdf.dissolve()
-            gdfs.append(gdf)
-        gdf_all = pd.concat(gdfs)
+        gdf_all = pd.concat(
+            [
+                gpd.read_parquet(get_country_path(iso3, adm_level)).assign(
+                    iso3=iso3
+                )
+                for iso3 in ISO3S
+            ]
+        )
 
         # aggregate relevant regions
         for region in REGIONS:
             if region["adm_level"] == adm_level:
                 gdf_region_in = gdf_all[
-                    gdf_all[f"ADM{adm_level}_PCODE"].isin(region["pcodes"])
+                    gdf_all["pcode"].isin(region["pcodes"])
                 ]
                 gdf_region_in = gdf_region_in.dissolve()
                 gdf_region_in[
                     "pcode"
                 ] = f'{region["iso3"]}_region_{region["region_number"]}'
                 gdf_region_in["name"] = region["region_name"]
-                gdf_region_in = gdf_region_in[["pcode", "name", "geometry"]]
+                gdf_region_in["iso3"] = region["iso3"]
+                gdf_region_in = gdf_region_in[
+                    ["pcode", "name", "iso3", "geometry"]
+                ]
                 region_gdfs.append(gdf_region_in)
 
         if adm_level == 0:
-            gdf_all_outline = gdf_all.copy()
+            write_shard_index(gdf_all)
+            gdf_all_outline = gdf_all.drop(columns="iso3")
             gdf_all_outline.geometry = gdf_all_outline.geometry.boundary
             gdf_all_outline = gpd.GeoDataFrame(
                 gdf_all_outline, geometry="geometry"
             )
-            gdf_all_outline = clean_gdf(gdf_all_outline, adm_level)
             gdf_all_outline.to_file(
                 f"assets/geo/adm{adm_level}_outline.json", driver="GeoJSON"
             )
 
-        gdf_all.geometry = gdf_all.geometry
         gdf_all = gpd.GeoDataFrame(gdf_all, geometry="geometry")
-        gdf_all = clean_gdf(gdf_all, adm_level)
-        gdf_all["geometry"] = gdf_all.geometry.simplify(tolerance=0.005)
-        gdf_all.to_file(f"assets/geo/adm{adm_level}.json", driver="GeoJSON")
+        write_boundaries(gdf_all, f"adm{adm_level}")
 
     region_gdf = pd.concat(region_gdfs)
     region_gdf = gpd.GeoDataFrame(region_gdf, geometry="geometry")
-    region_gdf.to_file("assets/geo/admregion.json", driver="GeoJSON")
+    # The default region boundaries aren't simplified, as before
+    write_boundaries(region_gdf, "admregion", tolerance=None)
+    save_manifest(etags)
     print("All data processed.")
@@ -1,13 +1,51 @@
 import dash_bootstrap_components as dbc
 import dash_leaflet as dl
+import dash_leaflet.express as dlx
 import dash_mantine_components as dmc
 from dash import dcc, html
+from dash_extensions.javascript import arrow_function, assign
 
-from constants import ATTRIBUTION, ROLLING_WINDOW, URL
+from constants import ATTRIBUTION, MAP_FORMAT, ROLLING_WINDOW, URL, URL_LABELS
+from utils.geo_utils import bounds_to_rect
 
 NAVBAR_HEIGHT = 60 + 48
 GUTTER = 0
 
+COLORSCALE = ["#fafafa", "#e0e0e0", "#b8b8b8", "#f7a29c", "#da5a51"]
+
+style_handle = assign(
+    """
+    function(feature, context) {
+        const {colorscale, style, colorProp, selected, quantiles} = context.hideout;  // get props from hideout
+        // get value that determines the color, from the hideout if the features don't have it
+        const value = quantiles ? quantiles[feature.properties.pcode] : feature.properties[colorProp];
+        let featureStyle = {...style};
+
+        // Only modify opacity if this feature's pcode matches selected
+        if (selected === feature.properties.pcode) {
+            featureStyle.fillOpacity = 1;
+            featureStyle.color = "black";
+            featureStyle.weight = 1;
+        }
+
+        // Set color based on value
+        if (value === -2) {
+            featureStyle.fillColor = colorscale[0];
+        } else if (value === -1) {
+            featureStyle.fillColor = colorscale[1];
+        } else if (value === 0) {
+            featureStyle.fillColor = colorscale[2];
+        } else if (value === 1) {
+            featureStyle.fillColor = colorscale[3];
+        } else if (value === 2) {
+            featureStyle.fillColor = colorscale[4];
+        }
+
+        return featureStyle;
+    }
+"""
+)
+
 
 def content():
     return dbc.Container(
@@ -138,7 +176,7 @@ def map_container():
         id="map-container",
         children=[
             dl.Map(
-                [dl.TileLayer(url=URL, attribution=ATTRIBUTION)],
+                map_layers(),
                 style={"width": "100%", "height": "100%"},
                 center=[0, 22],
                 zoom=3,
@@ -175,6 +213,89 @@ def map_container():
     )
 
 
+def map_layers():
+    """Layers of the map, which stay in place when the admin level changes.
+
+    Callbacks only set the boundary URL, the quantiles and selection in the
+    `geojson` hideout, and the title.
+    """
+    colorbar = dlx.categorical_colorbar(
+        categories=[
+            "Well below<br>normal",
+            "Below normal",
+            "Normal",
+            "Above normal",
+            "Well above<br>normal",
+        ],
+        colorscale=COLORSCALE,
+        width=300,
+        height=15,
+        position="bottomleft",
+    )
+    title = html.Div(
+        id="map-title",
+        style={
+            "position": "absolute",
+            "bottom": "60px",
+            "left": "10px",
+            "zIndex": 1000,
+            "fontSize": "12px",
+            "paddingBottom": "5px",
+            "fontWeight": "bold",
+        },
+    )
+
+    style = dict(weight=1, opacity=1, color="white", fillOpacity=0.75)
+    hideout = dict(
+        colorscale=COLORSCALE,
+        style=style,
+        colorProp="quantile",
+        selected="",
+    )
+    extra_children = []
+    if MAP_FORMAT == "flatgeobuf":
+        data_props = dict(
+            format="flatgeobuf",
+            formatOptions={"rect": bounds_to_rect(None)},
+        )
+    elif MAP_FORMAT == "topojson":
+        # Loaded from the URL in this store, see assets/topojson.js
+        data_props = {}
+        extra_children.append(dcc.Store(id="boundary-url"))
+    else:
+        data_props = {}
+
+    geojson = dl.GeoJSON(
+        **data_props,
+        id="geojson",
+        style=style_handle,
+        hideout=hideout,
+        hoverStyle=arrow_function(
+            {"fillOpacity": 1, "weight": 1, "color": "black"}
+        ),
+        zoomToBounds=False,
+    )
+    adm0 = dl.GeoJSON(
+        url="assets/geo/adm0_outline.json",
+        id="adm0-geojson",
+        style={"color": "#353535", "weight": 1.5},
+    )
+
+    return [
+        dl.TileLayer(url=URL, attribution=ATTRIBUTION),
+        dl.Pane(adm0, style={"zIndex": 1001}, name="adm0"),
+        dl.Pane(geojson, style={"zIndex": 1000}, name="sel"),
+        dl.Pane(
+            dl.TileLayer(url=URL_LABELS, attribution=ATTRIBUTION),
+            name="tile",
+            style={"zIndex": 1002},
+        ),
+        title,
+        colorbar,
+        *extra_children,
+    ]
+
+
 def card_title(text, chart_id):
     return html.Div(
         style={
@@ -0,0 +1,79 @@
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from constants import ADM_LEVELS, ROLLING_WINDOW
+from utils.data_utils import (
+    calculate_return_periods_batch,
+    get_data_version,
+    process_flood_data_batch,
+)
+from utils.db_utils import get_connection
+from utils.store_utils import get_exposure_table_name, write_stats
+
+PCODE_BATCH_SIZE = 200
+
+
+def fetch_pcodes(adm_level):
+    query = text(
+        f"""
+        SELECT DISTINCT pcode
+        FROM app.{get_exposure_table_name(adm_level)}
+        WHERE adm_level=:adm_level
+        """
+    )
+    with get_connection() as con:
+        df = pd.read_sql_query(query, con, params={"adm_level": adm_level})
+    return sorted(df["pcode"])
+
+
+def fetch_exposure_batch(pcodes, adm_level):
+    query = text(
+        f"""
+        SELECT *
+        FROM app.{get_exposure_table_name(adm_level)}
+        WHERE pcode IN :pcodes AND adm_level=:adm_level
+        """
+    ).bindparams(bindparam("pcodes", expanding=True))
+    with get_connection() as con:
+        df = pd.read_sql_query(
+            query, con, params={"pcodes": pcodes, "adm_level": adm_level}
+        )
+    return df
+
+
+def compute_stats(df_exposure):
+    """Compute the processed, seasonal and peak data for each pcode in
+    `df_exposure`, as used by the charts."""
+    val_col = f"roll{ROLLING_WINDOW}"
+    df_processed, df_seasonal, df_peaks = process_flood_data_batch(df_exposure)
+    df_peaks = calculate_return_periods_batch(df_peaks)
+    return {
+        "processed": df_processed[["pcode", "date", "eff_date", val_col]],
+        "seasonal": df_seasonal,
+        "peaks": df_peaks,
+    }
+
+
+if __name__ == "__main__":
+    for adm_level in [str(x) for x in ADM_LEVELS] + ["region"]:
+        print(f"Precomputing stats for admin {adm_level}...")
+        # Tag the output with the version that the app compares against. It
+        # is taken before fetching, so that data published during the run
+        # makes the stats stale rather than mislabelled.
+        data_version = get_data_version(adm_level)
+        pcodes = fetch_pcodes(adm_level)
+        batches = []
+        for i in range(0, len(pcodes), PCODE_BATCH_SIZE):
+            df_exposure = fetch_exposure_batch(
+                pcodes[i : i + PCODE_BATCH_SIZE], adm_level
+            )
+            batches.append(compute_stats(df_exposure))
+        if not batches:
+            print(f"No data for admin {adm_level}, skipping")
+            continue
+        tables = {
+            kind: pd.concat([batch[kind] for batch in batches])
+            for kind in batches[0].keys()
+        }
+        write_stats(tables, adm_level, data_version)
+    print("All stats precomputed.")
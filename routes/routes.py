@@ -0,0 +1,171 @@
+import gzip
+import os
+import time
+
+from flask import abort, g, make_response, request, send_file
+
+from constants import GEO_LODS, GEO_MAX_AGE, ISO3S
+from utils.data_utils import ADM_LOOKUP_LEVELS
+from utils.db_utils import pool_stats
+from utils.geo_utils import (
+    get_boundary_path,
+    get_compressed_topojson,
+    get_file_version,
+    get_flatgeobuf_path,
+    get_joined_geojson,
+    get_joined_shards,
+    get_joined_version,
+    get_topojson_path,
+    get_topojson_version,
+)
+from utils.metrics_utils import (
+    callback_payload_bytes,
+    callback_seconds,
+    render_metrics,
+)
+from utils.pipeline_utils import result_cache
+
+
+def get_lod_arg():
+    lod = request.args.get("lod", type=int)
+    return lod if lod is not None and 0 <= lod < len(GEO_LODS) else None
+
+
+def check_boundary_path(adm_level, path):
+    """Abort with a 404 for admin levels without boundaries, or whose
+    boundary file hasn't been written, e.g. admin 2 without a rerun of
+    download_geodata.py."""
+    if adm_level not in ADM_LOOKUP_LEVELS or not os.path.exists(path):
+        abort(404)
+
+
+def set_cache_headers(response, version):
+    response.vary.add("Accept-Encoding")
+    # The map requests the current version explicitly, so responses can be
+    # cached for as long as it takes new data to come in
+    response.cache_control.public = True
+    response.cache_control.max_age = GEO_MAX_AGE
+    response.set_etag(version)
+    return response
+
+
+def make_not_modified_response(version):
+    """Get a 304 response if the client already has `version`, so that the
+    body doesn't need to be built, or else `None`."""
+    if version not in request.if_none_match:
+        return None
+    return set_cache_headers(make_response("", 304), version)
+
+
+def make_gzip_response(body, version):
+    if "gzip" in request.accept_encodings:
+        response = make_response(body)
+        response.content_encoding = "gzip"
+    else:
+        response = make_response(gzip.decompress(body))
+    response.content_type = "application/json"
+    set_cache_headers(response, version)
+    return response.make_conditional(request)
+
+
+def get_counters():
+    counters = {
+        "app_db_checkouts_total": (
+            "Database connections checked out",
+            pool_stats["checkouts"],
+        ),
+        "app_db_checkout_wait_seconds_total": (
+            "Time spent waiting for database connections",
+            pool_stats["wait_total"],
+        ),
+    }
+    if result_cache is not None:
+        counters["app_result_cache_hits_total"] = (
+            "Charts served from the result cache",
+            result_cache.hits,
+        )
+        counters["app_result_cache_misses_total"] = (
+            "Charts computed as they were not in the result cache",
+            result_cache.misses,
+        )
+    return counters
+
+
+def get_gauges():
+    return {
+        "app_db_checkout_wait_seconds_max": (
+            "Longest wait for a database connection",
+            pool_stats["wait_max"],
+        ),
+    }
+
+
+def register_routes(app):
+    server = app.server
+
+    @server.before_request
+    def start_timer():
+        g.start = time.perf_counter()
+
+    @server.after_request
+    def record_callback(response):
+        # Dash callbacks are all requests to the same route, told apart by
+        # their outputs
+        if request.path.endswith("/_dash-update-component"):
+            output = (request.get_json(silent=True) or {}).get("output")
+            callback = app.callback_map.get(output, {}).get("callback")
+            name = getattr(callback, "__name__", "unknown")
+            callback_seconds.observe(name, time.perf_counter() - g.start)
+            if response.content_length is not None:
+                callback_payload_bytes.observe(name, response.content_length)
+        return response
+
+    @server.route("/metrics")
+    def metrics():
+        response = make_response(render_metrics(get_counters(), get_gauges()))
+        response.content_type = "text/plain; version=0.0.4"
+        return response
+
+    @server.route("/geo/adm<adm_level>.json")
+    def boundaries(adm_level):
+        iso3s = request.args.get("iso3")
+        lod = get_lod_arg()
+        check_boundary_path(adm_level, get_boundary_path(adm_level, lod))
+        not_modified = make_not_modified_response(
+            get_joined_version(adm_level, lod)
+        )
+        if not_modified is not None:
+            return not_modified
+        if iso3s is not None:
+            # Only the countries in view
+            iso3s = [iso3 for iso3 in iso3s.split(",") if iso3 in ISO3S]
+            version, body = get_joined_shards(adm_level, iso3s, lod)
+        else:
+            version, body = get_joined_geojson(adm_level, lod)
+        return make_gzip_response(body, version)
+
+    @server.route("/geo/adm<adm_level>.topojson")
+    def boundaries_topojson(adm_level):
+        lod = get_lod_arg()
+        check_boundary_path(adm_level, get_topojson_path(adm_level, lod))
+        not_modified = make_not_modified_response(
+            get_topojson_version(adm_level, lod)
+        )
+        if not_modified is not None:
+            return not_modified
+        version, body = get_compressed_topojson(adm_level, lod)
+        return make_gzip_response(body, version)
+
+    @server.route("/geo/adm<adm_level>.fgb")
+    def boundaries_flatgeobuf(adm_level):
+        path = get_flatgeobuf_path(adm_level, get_lod_arg())
+        check_boundary_path(adm_level, path)
+        # Conditional responses support the range requests used to read
+        # only the features in view
+        return send_file(
+            path,
+            mimetype="application/octet-stream",
+            conditional=True,
+            etag=get_file_version(path),
+            max_age=GEO_MAX_AGE,
+        )
@@ -0,0 +1,84 @@
+import pytest
+
+from benchmarks.synthetic_data import make_exposure
+from utils.chart_utils import (
+    create_return_period_plot,
+    create_timeseries_plot,
+    get_chart_data,
+)
+from utils.data_utils import (
+    calculate_return_periods,
+    process_flood_data,
+    update_flood_data,
+)
+
+
+@pytest.fixture(scope="module")
+def df_exposure():
+    return make_exposure(["XX0000"], adm_level=1)
+
+
+@pytest.fixture(scope="module")
+def processed(df_exposure):
+    return process_flood_data(df_exposure)
+
+
+@pytest.fixture(scope="module")
+def peaks(processed):
+    _, _, df_peaks = processed
+    return calculate_return_periods(df_peaks.copy())
+
+
+def test_process_flood_data(benchmark, df_exposure):
+    df_processed, df_seasonal, df_peaks = benchmark(
+        process_flood_data, df_exposure
+    )
+    assert df_processed["date"].is_unique
+    assert df_seasonal["dayofyear"].is_unique
+    assert df_peaks["date"].is_unique
+
+
+def test_update_flood_data_one_day(benchmark, df_exposure):
+    # As kept with EXPOSURE_HISTORY, the day before the latest data
+    previous = process_flood_data(df_exposure.iloc[:-1])
+    df_processed, _, _ = benchmark(
+        update_flood_data, *previous, df_exposure.iloc[-1:]
+    )
+    assert len(df_processed) == len(df_exposure)
+
+
+def test_calculate_return_periods(benchmark, processed):
+    _, _, df_peaks = processed
+    # Works on a copy, as it adds columns
+    df_peaks, _ = benchmark.pedantic(
+        calculate_return_periods,
+        setup=lambda: ((df_peaks.copy(),), {}),
+        rounds=50,
+    )
+    assert df_peaks["rank"].min() == 1
+
+
+def test_create_timeseries_plot(benchmark, processed, peaks):
+    df_processed, df_seasonal, _ = processed
+    _, peak_years = peaks
+    fig = benchmark(
+        create_timeseries_plot, df_seasonal, df_processed, peak_years
+    )
+    n_years = df_processed["date"].dt.year.nunique()
+    assert len(fig.data) == n_years + 1
+
+
+def test_create_return_period_plot(benchmark, peaks):
+    df_peaks, _ = peaks
+    fig = benchmark(create_return_period_plot, df_peaks)
+    assert len(fig.data) == 3
+
+
+def test_get_chart_data(benchmark, processed, peaks):
+    df_processed, df_seasonal, _ = processed
+    df_peaks, peak_years = peaks
+    chart_data = benchmark(
+        get_chart_data, df_seasonal, df_processed, df_peaks, peak_years
+    )
+    n_years = df_processed["date"].dt.year.nunique()
+    assert len(chart_data["years"]) == n_years
@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic_data import make_exposure, make_pcodes
+from utils.data_utils import (
+    calculate_return_periods,
+    calculate_return_periods_batch,
+    process_flood_data,
+    process_flood_data_batch,
+)
+
+
+@pytest.fixture(scope="module")
+def df_exposure():
+    # Include a pcode whose data ends earlier than the others, since the
+    # to-date peaks are cut off at each pcode's own latest day of the year
+    return pd.concat(
+        [
+            make_exposure(make_pcodes(5), adm_level=1),
+            make_exposure(["YY0000"], adm_level=1, end_date="2024-02-29"),
+        ]
+    ).sample(frac=1, random_state=0)
+
+
+def test_batch_matches_each_pcode(df_exposure):
+    df_processed, df_seasonal, df_peaks = process_flood_data_batch(df_exposure)
+    df_peaks = calculate_return_periods_batch(df_peaks)
+    batch = (df_processed, df_seasonal, df_peaks)
+
+    for pcode, df_pcode in df_exposure.groupby("pcode"):
+        single_processed, single_seasonal, single_peaks = process_flood_data(
+            df_pcode
+        )
+        single_peaks, _ = calculate_return_periods(single_peaks)
+        single = (single_processed, single_seasonal, single_peaks)
+        for df_single, df_batch in zip(single, batch):
+            df_batch = df_batch[df_batch["pcode"] == pcode]
+            if "pcode" not in df_single.columns:
+                df_batch = df_batch.drop(columns="pcode")
+            pd.testing.assert_frame_equal(
+                df_single.reset_index(drop=True),
+                df_batch.reset_index(drop=True),
+                check_like=True,
+            )
@@ -0,0 +1,60 @@
+import pytest
+from dash._utils import to_json
+
+from benchmarks.synthetic_data import make_exposure
+from utils import chart_utils, pipeline_utils
+from utils.data_utils import process_flood_data
+
+# Size limit of the update_plot outputs for a location, with the chart data
+# as binary arrays, on slow connections
+MAX_PAYLOAD_KB = 300
+
+ADM_NAMES = {"adm0_name": "Country", "adm1_name": "Location"}
+
+
+@pytest.fixture(scope="module")
+def processed():
+    df_exposure = make_exposure(["XX0000"], adm_level=1)
+    return process_flood_data(df_exposure)
+
+
+@pytest.fixture
+def get_payload_size(monkeypatch, processed):
+    """Get the size in kB of the serialized update_plot outputs for a
+    location, built from synthetic data rather than the database."""
+    monkeypatch.setattr(
+        pipeline_utils, "get_precomputed_stats", lambda *args: None
+    )
+    monkeypatch.setattr(
+        pipeline_utils, "get_processed_flood_data", lambda *args: processed
+    )
+    monkeypatch.setattr(
+        pipeline_utils, "get_admin_names", lambda *args: ADM_NAMES
+    )
+
+    def get_size(binary, clientside):
+        monkeypatch.setattr(chart_utils, "BINARY_FIGURES", binary)
+        monkeypatch.setattr(pipeline_utils, "CLIENTSIDE_CHARTS", clientside)
+        outputs = pipeline_utils.compute_plot_outputs(
+            "XX0000", "1", quantile=0, data_version=None
+        )
+        # As serialized in the update_plot response
+        return len(to_json(outputs)) / 1e3
+
+    return get_size
+
+
+def test_binary_payload_under_limit(get_payload_size):
+    assert get_payload_size(binary=True, clientside=False) <= MAX_PAYLOAD_KB
+
+
+def test_binary_smaller_than_lists(get_payload_size):
+    size_binary = get_payload_size(binary=True, clientside=False)
+    size_lists = get_payload_size(binary=False, clientside=False)
+    assert size_binary < size_lists
+
+
+def test_chart_data_smaller_than_figures(get_payload_size):
+    size_data = get_payload_size(binary=True, clientside=True)
+    size_binary = get_payload_size(binary=True, clientside=False)
+    assert size_data < size_binary
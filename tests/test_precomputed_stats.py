@@ -0,0 +1,45 @@
+import pytest
+
+from benchmarks.synthetic_data import make_exposure, make_pcodes
+from precompute_stats import compute_stats
+from utils import store_utils
+from utils.chart_utils import get_chart_data
+from utils.data_utils import (
+    calculate_return_periods,
+    get_peak_years,
+    process_flood_data,
+)
+
+DATA_VERSION = "2024-06-30"
+
+
+@pytest.fixture
+def df_exposure():
+    return make_exposure(make_pcodes(3), adm_level=1, end_date=DATA_VERSION)
+
+
+@pytest.fixture
+def stats_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(store_utils, "STATS_DIR", str(tmp_path))
+    monkeypatch.setattr(store_utils, "_stats", {})
+    return tmp_path
+
+
+def test_chart_data_from_precomputed_stats(df_exposure, stats_dir):
+    store_utils.write_stats(compute_stats(df_exposure), "1", DATA_VERSION)
+
+    for pcode, df_pcode in df_exposure.groupby("pcode"):
+        stats = store_utils.get_precomputed_stats(pcode, "1", DATA_VERSION)
+        assert stats is not None
+        df_processed, df_seasonal, df_peaks = stats
+        # The precomputed peaks are sorted by return period
+        peak_years = sorted(get_peak_years(df_peaks))
+        chart_data = get_chart_data(
+            df_seasonal, df_processed, df_peaks, peak_years
+        )
+
+        df_processed, df_seasonal, df_peaks = process_flood_data(df_pcode)
+        df_peaks, peak_years = calculate_return_periods(df_peaks)
+        assert chart_data == get_chart_data(
+            df_seasonal, df_processed, df_peaks, sorted(peak_years)
+        )
@@ -0,0 +1,88 @@
+import time
+
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic_data import make_exposure
+from utils import data_utils, store_utils
+from utils.data_utils import process_flood_data, update_flood_data
+
+
+@pytest.fixture
+def history_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(store_utils, "EXPOSURE_HISTORY_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def n_full_runs(monkeypatch):
+    """Count the calls of `process_flood_data` made by
+    `update_flood_data`."""
+    calls = []
+
+    def counted(df_exposure):
+        calls.append(len(df_exposure))
+        return process_flood_data(df_exposure)
+
+    monkeypatch.setattr(data_utils, "process_flood_data", counted)
+    return calls
+
+
+def get_exposure(monkeypatch, end_date):
+    # The current year, whose data is updated day by day
+    monkeypatch.setattr(data_utils, "CUR_YEAR", pd.Timestamp(end_date).year)
+    return make_exposure(["XX0000"], adm_level=1, end_date=end_date)
+
+
+def assert_tables_equal(tables, expected):
+    for df, df_expected in zip(tables, expected):
+        pd.testing.assert_frame_equal(
+            df.reset_index(drop=True), df_expected.reset_index(drop=True)
+        )
+
+
+def round_trip(tables, data_version):
+    store_utils.write_exposure_history(
+        "XX0000", "1", tables, data_version, synced=time.time()
+    )
+    history = store_utils.read_exposure_history("XX0000", "1")
+    assert history["data_version"] == data_version
+    return history["tables"]
+
+
+@pytest.mark.parametrize("n_new", [1, 3, 10])
+@pytest.mark.parametrize("from_history", [False, True])
+def test_update_matches_full_run(
+    monkeypatch, history_dir, n_full_runs, n_new, from_history
+):
+    df_exposure = get_exposure(monkeypatch, "2024-06-30")
+    df_old, df_new = df_exposure.iloc[:-n_new], df_exposure.iloc[-n_new:]
+    tables = process_flood_data(df_old)
+    if from_history:
+        tables = round_trip(tables, str(df_old["valid_date"].iloc[-1]))
+
+    updated = update_flood_data(*tables, df_new)
+    assert not n_full_runs
+    assert_tables_equal(updated, process_flood_data(df_exposure))
+
+
+def test_new_year_runs_in_full(monkeypatch, n_full_runs):
+    df_exposure = get_exposure(monkeypatch, "2025-01-03")
+    df_old, df_new = df_exposure.iloc[:-3], df_exposure.iloc[-3:]
+    assert df_old["valid_date"].iloc[-1] == pd.Timestamp("2024-12-31").date()
+
+    updated = update_flood_data(*process_flood_data(df_old), df_new)
+    assert n_full_runs == [len(df_exposure)]
+    assert_tables_equal(updated, process_flood_data(df_exposure))
+
+
+def test_overlapping_dates_run_in_full(monkeypatch, n_full_runs):
+    df_exposure = get_exposure(monkeypatch, "2024-06-30")
+    # The last two processed days are published again, with new values
+    df_old, df_new = df_exposure.iloc[:-3], df_exposure.iloc[-5:].copy()
+    df_new["sum"] = df_new["sum"] * 2
+    df_expected = pd.concat([df_exposure.iloc[:-5], df_new])
+
+    updated = update_flood_data(*process_flood_data(df_old), df_new)
+    assert n_full_runs == [len(df_exposure)]
+    assert_tables_equal(updated, process_flood_data(df_expected))
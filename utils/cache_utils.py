@@ -0,0 +1,184 @@
+import fcntl
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from constants import (
+    RESULT_CACHE_BACKEND,
+    RESULT_CACHE_DIR,
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_TTL,
+)
+from utils.log_utils import get_logger
+
+logger = get_logger("cache")
+
+
+class KeyLocks:
+    """Locks per key, created when first needed and dropped once no thread
+    holds or waits on them."""
+
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, key):
+        with self._lock:
+            lock, users = self._locks.get(key, (threading.Lock(), 0))
+            self._locks[key] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                users = self._locks[key][1] - 1
+                if users:
+                    self._locks[key] = (lock, users)
+                else:
+                    del self._locks[key]
+
+
+class MemoryCache:
+    """Bounded LRU cache with a TTL, local to the worker process."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = KeyLocks()
+
+    def lock(self, key):
+        """Lock a key against other threads, so that concurrent requests for
+        the same value wait for it to be computed once."""
+        return self._key_locks.hold(key)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class FileSystemCache:
+    """Bounded LRU cache with a TTL, stored as pickles in a directory.
+
+    The directory can be shared by all gunicorn workers. Recency is tracked
+    through file mtimes, which are bumped on every hit.
+    """
+
+    def __init__(self, directory, max_entries, ttl):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._key_locks = KeyLocks()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, extension="pkl"):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.{extension}")
+
+    @contextmanager
+    def lock(self, key):
+        """Lock a key against other threads and workers, so that concurrent
+        requests for the same value wait for it to be computed once."""
+        with self._key_locks.hold(key):
+            with open(self._path(key, "lock"), "a") as file:
+                fcntl.flock(file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            expired = time.time() - os.path.getmtime(path) > self.ttl
+            if not expired:
+                with open(path, "rb") as file:
+                    value = pickle.load(file)
+                os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            expired = True
+        if expired:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        # Write to a temporary file first so that other workers never read
+        # a partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".lock"):
+                self._remove_stale_lock(entry)
+            elif entry.name.endswith(".pkl"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    continue
+        entries.sort()
+        for _, path in entries[: max(len(entries) - self.max_entries, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _remove_stale_lock(self, entry):
+        # At worst, a request holding a lock that is removed computes its
+        # value alongside another
+        try:
+            if time.time() - entry.stat().st_mtime > self.ttl:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def create_cache(name):
+    """Create a cache according to the `RESULT_CACHE_BACKEND` setting.
+
+    Returns `None` if caching is disabled.
+    """
+    if RESULT_CACHE_BACKEND == "none":
+        return None
+    if RESULT_CACHE_BACKEND == "filesystem":
+        return FileSystemCache(
+            os.path.join(RESULT_CACHE_DIR, name),
+            max_entries=RESULT_CACHE_MAX_ENTRIES,
+            ttl=RESULT_CACHE_TTL,
+        )
+    if RESULT_CACHE_BACKEND == "memory":
+        return MemoryCache(
+            max_entries=RESULT_CACHE_MAX_ENTRIES, ttl=RESULT_CACHE_TTL
+        )
+    raise ValueError(f"Invalid result cache backend: {RESULT_CACHE_BACKEND}")
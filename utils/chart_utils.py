@@ -1,19 +1,31 @@
+import numpy as np
+import pandas as pd
 import plotly.graph_objects as go
 
-from constants import CHD_BLUE, CHD_GREY, CHD_RED, CUR_YEAR, ROLLING_WINDOW
+from constants import (
+    BINARY_FIGURES,
+    CHD_BLUE,
+    CHD_GREY,
+    CHD_RED,
+    COMPACT_TIMESERIES,
+    CUR_YEAR,
+    ROLLING_WINDOW,
+)
+
+DAY_MS = 24 * 60 * 60 * 1000
 
 
 def create_timeseries_plot(df_seasonal, df_processed, peak_years):
     """Create timeseries plot using Plotly."""
     df_seasonal = df_seasonal.sort_values("eff_date")
     df_processed = df_processed.sort_values("date", ascending=False)
+    val_col = f"roll{ROLLING_WINDOW}"
     fig = go.Figure()
 
     # Add seasonal average
     fig.add_trace(
         go.Scatter(
-            x=df_seasonal["eff_date"],
-            y=df_seasonal[f"roll{ROLLING_WINDOW}"],
+            **to_daily_xy(df_seasonal["eff_date"], df_seasonal[val_col]),
             name="Average",
             line_color="black",
             line_width=2,
@@ -21,27 +33,9 @@ def create_timeseries_plot(df_seasonal, df_processed, peak_years):
     )
 
     # Add yearly traces
-    for year in df_processed["date"].dt.year.unique():
-        color = (
-            CHD_BLUE
-            if year == CUR_YEAR
-            else CHD_RED
-            if year in peak_years
-            else CHD_BLUE
-        )
-        linewidth = 3 if year == CUR_YEAR else 0.2
-
-        df_year = df_processed[df_processed["date"].dt.year == year]
-        fig.add_trace(
-            go.Scatter(
-                x=df_year["eff_date"],
-                y=df_year[f"roll{ROLLING_WINDOW}"],
-                name=str(year),
-                mode="lines",
-                line_color=color,
-                line_width=linewidth,
-            )
-        )
+    years = df_processed["date"].dt.year
+    for year, df_year in df_processed.groupby(years, sort=False):
+        fig.add_trace(get_year_trace(df_year, year, peak_years))
 
     # Highlight most recent date
     date_max = df_processed.date.max()
@@ -60,48 +54,82 @@ def create_timeseries_plot(df_seasonal, df_processed, peak_years):
         annotation_font_color=CHD_GREY,
     )
 
-    fig.update_layout(
-        template="simple_white",
-        xaxis=dict(
-            tickformat="%b",
-            dtick="M1",
-            showticklabels=True,
-            ticklen=0,
-            title=None,
-            color=CHD_GREY,
-        ),
-        yaxis=dict(ticklen=0),
-        legend_title="Year<br><sup>(click to toggle)</sup>",
-        height=240,
-        margin={"t": 10, "l": 0, "r": 0, "b": 0},
-        font=dict(
-            family="Source Sans Pro, sans-serif",
-            color="#888888",  # Colors all text
-        ),
-        hoverlabel=dict(
-            bgcolor="white",
-            font_size=11,
-            font_family="Source Sans Pro, sans-serif",
-        ),
-    )
-
-    y_max = df_processed[f"roll{ROLLING_WINDOW}"].max()
+    y_max = df_processed[val_col].max()
     tick_interval = round(y_max / 4, -3)
 
-    fig.update_yaxes(
-        title="Population",
-        color=CHD_GREY,
-        dtick=tick_interval,
-        showgrid=True,
-        gridwidth=1,
-        gridcolor="#eeeeee",
-        zeroline=False,
-    )
-    fig.update_xaxes(range=["1900-01-01", "1900-12-31"])
+    fig.update_layout(get_timeseries_layout())
+    fig.update_yaxes(dtick=tick_interval)
 
     return fig
 
 
+def to_chart_dates(dates):
+    """Convert dates for a chart, with missing dates as gaps.
+
+    With `BINARY_FIGURES`, dates are milliseconds since the epoch, in a float
+    array that Plotly sends as binary. Floats hold the milliseconds exactly,
+    and Plotly doesn't send 64-bit integers as binary. Otherwise, dates are
+    a list of ISO date strings.
+    """
+    if BINARY_FIGURES:
+        ms = dates.to_numpy().astype("datetime64[ms]").astype(np.int64)
+        ms = ms.astype(np.float64)
+        ms[dates.isna().to_numpy()] = np.nan
+        return ms
+    return _to_list(dates.dt.strftime("%Y-%m-%d"))
+
+
+def to_chart_values(values):
+    """Convert numbers for a chart, with missing values as gaps.
+
+    With `BINARY_FIGURES`, values are single precision floats, which is
+    plenty for a chart and halves their size, in an array that Plotly sends
+    as binary. Otherwise, values are a list.
+    """
+    if BINARY_FIGURES:
+        return values.to_numpy(dtype=np.float32)
+    return _to_list(values)
+
+
+def _to_list(values):
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+def get_year_trace(df_year, year, peak_years):
+    color = (
+        CHD_BLUE
+        if year == CUR_YEAR
+        else CHD_RED if year in peak_years else CHD_BLUE
+    )
+    linewidth = 3 if year == CUR_YEAR else 0.2
+    return go.Scatter(
+        **to_daily_xy(df_year["eff_date"], df_year[f"roll{ROLLING_WINDOW}"]),
+        name=str(year),
+        mode="lines",
+        line_color=color,
+        line_width=linewidth,
+    )
+
+
+def to_daily_xy(dates, values):
+    """Get the x and y of a trace of daily values.
+
+    With `COMPACT_TIMESERIES`, the dates are given by the first one and a
+    step of one day (`x0` and `dx`) rather than one per point, with missing
+    days as gaps. Otherwise, each point has its date.
+    """
+    if not COMPACT_TIMESERIES:
+        return dict(x=to_chart_dates(dates), y=to_chart_values(values))
+    days = (dates - dates.min()).dt.days.to_numpy()
+    daily = pd.Series(np.nan, index=range(days.max() + 1))
+    daily[days] = values.to_numpy()
+    return dict(
+        x0=f"{dates.min():%Y-%m-%d}",
+        dx=DAY_MS,
+        y=to_chart_values(daily),
+    )
+
+
 def create_return_period_plot(df_peaks, rp=3):
     """Create return period plot using Plotly."""
     fig = go.Figure()
@@ -109,8 +137,8 @@ def create_return_period_plot(df_peaks, rp=3):
     # Add all years trace
     fig.add_trace(
         go.Scatter(
-            x=df_peaks["rp"],
-            y=df_peaks[f"roll{ROLLING_WINDOW}"],
+            x=to_chart_values(df_peaks["rp"]),
+            y=to_chart_values(df_peaks[f"roll{ROLLING_WINDOW}"]),
             name="all years",
             mode="lines",
             line_color="#353535",
@@ -149,8 +177,8 @@ def create_return_period_plot(df_peaks, rp=3):
     ]
     fig.add_trace(
         go.Scatter(
-            x=df_rp_peaks["rp"],
-            y=df_rp_peaks[f"roll{ROLLING_WINDOW}"],
+            x=to_chart_values(df_rp_peaks["rp"]),
+            y=to_chart_values(df_rp_peaks[f"roll{ROLLING_WINDOW}"]),
             text=df_rp_peaks["date"],
             name="≥3-yr RP years",
             textposition="top left",
@@ -164,18 +192,71 @@ def create_return_period_plot(df_peaks, rp=3):
     y_max = df_peaks[f"roll{ROLLING_WINDOW}"].max()
     tick_interval = round(y_max / 4, -3)
 
-    fig.update_layout(
+    fig.update_layout(get_return_period_layout())
+    fig.update_yaxes(dtick=tick_interval)
+
+    return fig
+
+
+def get_timeseries_layout():
+    """Get the layout of the timeseries chart, other than the parts that
+    depend on the data."""
+    return dict(
         template="simple_white",
-        xaxis=dict(dtick=5, ticklen=0, color=CHD_GREY),
+        xaxis=dict(
+            tickformat="%b",
+            dtick="M1",
+            showticklabels=True,
+            ticklen=0,
+            title=None,
+            color=CHD_GREY,
+            type="date",
+            range=["1900-01-01", "1900-12-31"],
+        ),
         yaxis=dict(
             ticklen=0,
-            dtick=tick_interval,
+            title="Population",
             color=CHD_GREY,
             showgrid=True,
             gridwidth=1,
             gridcolor="#eeeeee",
             zeroline=False,
         ),
+        legend_title="Year<br><sup>(click to toggle)</sup>",
+        height=240,
+        margin={"t": 10, "l": 0, "r": 0, "b": 0},
+        font=dict(
+            family="Source Sans Pro, sans-serif",
+            color="#888888",  # Colors all text
+        ),
+        hoverlabel=dict(
+            bgcolor="white",
+            font_size=11,
+            font_family="Source Sans Pro, sans-serif",
+        ),
+    )
+
+
+def get_return_period_layout():
+    """Get the layout of the return period chart, other than the parts that
+    depend on the data."""
+    return dict(
+        template="simple_white",
+        xaxis=dict(
+            dtick=5,
+            ticklen=0,
+            color=CHD_GREY,
+            title="Return period (years)",
+        ),
+        yaxis=dict(
+            ticklen=0,
+            color=CHD_GREY,
+            showgrid=True,
+            gridwidth=1,
+            gridcolor="#eeeeee",
+            zeroline=False,
+            title="Maximum population exposed",
+        ),
         height=240,
         showlegend=False,
         margin={"t": 10, "l": 0, "r": 0, "b": 0},
@@ -186,7 +267,64 @@ def create_return_period_plot(df_peaks, rp=3):
             font_family="Source Sans Pro, sans-serif",
         ),
     )
-    fig.update_yaxes(title="Maximum population exposed")
-    fig.update_xaxes(title="Return period (years)")
 
-    return fig
+
+def get_chart_styles():
+    """Get the layouts and colors of the charts, for them to be drawn in the
+    browser by assets/charts.js with `CLIENTSIDE_CHARTS`.
+
+    These are the same for every location, so are sent once with the page.
+    The template is expanded, as Plotly.js doesn't know it by name.
+    """
+    return {
+        "timeseries_layout": go.Layout(
+            **get_timeseries_layout()
+        ).to_plotly_json(),
+        "rp_layout": go.Layout(**get_return_period_layout()).to_plotly_json(),
+        "colors": {"blue": CHD_BLUE, "red": CHD_RED, "grey": CHD_GREY},
+    }
+
+
+def get_chart_data(df_seasonal, df_processed, df_peaks, peak_years, rp=3):
+    """Get the series drawn in the charts of a location, for them to be drawn
+    in the browser by assets/charts.js with `CLIENTSIDE_CHARTS`.
+
+    Daily series are given by the day of the year they start on and their
+    values, with missing days as `None`. Values are rounded to one decimal,
+    as that is all the charts show.
+    """
+    val_col = f"roll{ROLLING_WINDOW}"
+    # The precomputed stats don't keep the processed data's day of the year
+    days = df_processed["date"].dt.dayofyear
+    years = df_processed["date"].dt.year
+    date_max = df_processed["date"].max()
+    return {
+        "seasonal": _to_daily(df_seasonal["dayofyear"], df_seasonal[val_col]),
+        "years": [
+            {
+                "year": int(year),
+                **_to_daily(days[df_year.index], df_year[val_col]),
+            }
+            for year, df_year in df_processed.groupby(years)
+        ],
+        "cur_year": CUR_YEAR,
+        "peak_years": [int(year) for year in peak_years],
+        "date_max": f"{date_max:%Y-%m-%d}",
+        "timeseries_dtick": float(round(df_processed[val_col].max() / 4, -3)),
+        "peaks": {
+            "year": df_peaks["date"].astype(int).tolist(),
+            "rp": _to_list(df_peaks["rp"]),
+            "value": _to_list(df_peaks[val_col].round(1)),
+            "rank": _to_list(df_peaks["rank"]),
+            "is_rp": df_peaks[f"{rp}yr_rp"].astype(bool).tolist(),
+        },
+        "rp_dtick": float(round(df_peaks[val_col].max() / 4, -3)),
+    }
+
+
+def _to_daily(days, values):
+    days = days.to_numpy()
+    start = int(days.min())
+    daily = pd.Series(np.nan, index=range(start, int(days.max()) + 1))
+    daily[days] = values.round(1).to_numpy()
+    return {"start": start, "values": _to_list(daily)}
@@ -1,8 +1,13 @@
+import os
+import tempfile
 from typing import Literal
 
+import geopandas as gpd
 import ocha_stratus as stratus
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotModifiedError
 
-from constants import STAGE
+from constants import CODAB_CACHE_DIR, STAGE
 
 PROJECT_PREFIX = "ds-floodexposure-monitoring"
 
@@ -25,6 +30,66 @@ def get_blob_name(iso3: str):
     return f"{PROJECT_PREFIX}/raw/codab/{iso3}.shp.zip"
 
 
+def get_blob_client(blob_name, container_name: str = "projects"):
+    container_client = stratus.get_container_client(
+        stage=STAGE, container_name=container_name
+    )
+    return container_client.get_blob_client(blob_name)
+
+
+def download_codab(iso3: str):
+    """Download the CODAB zip for a country to `CODAB_CACHE_DIR`, unless the
+    copy there is already up to date.
+
+    Returns the ETag of the blob, which changes whenever it is replaced.
+    """
+    iso3 = iso3.lower()
+    etag_path = os.path.join(CODAB_CACHE_DIR, f"{iso3}.etag")
+    cached_etag = None
+    if os.path.exists(get_codab_path(iso3)) and os.path.exists(etag_path):
+        with open(etag_path) as file:
+            cached_etag = file.read()
+
+    # Only downloaded if changed, and with the ETag of the downloaded
+    # version, so that a blob replaced in the meantime isn't cached under the
+    # wrong ETag
+    blob_client = get_blob_client(get_blob_name(iso3))
+    conditions = {}
+    if cached_etag:
+        conditions = dict(
+            etag=cached_etag, match_condition=MatchConditions.IfModified
+        )
+    try:
+        downloader = blob_client.download_blob(**conditions)
+    except ResourceNotModifiedError:
+        return cached_etag
+    data = downloader.readall()
+    etag = downloader.properties.etag
+
+    os.makedirs(CODAB_CACHE_DIR, exist_ok=True)
+    # Write to a temporary file first so that an interrupted download is
+    # never mistaken for a complete one
+    fd, tmp_path = tempfile.mkstemp(dir=CODAB_CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "wb") as file:
+        file.write(data)
+    os.replace(tmp_path, get_codab_path(iso3))
+    with open(etag_path, "w") as file:
+        file.write(etag)
+    return etag
+
+
+def get_codab_path(iso3: str):
+    return os.path.join(CODAB_CACHE_DIR, f"{iso3.lower()}.shp.zip")
+
+
+def load_codab(iso3: str, admin_level: int = 0):
+    """Load an admin level from a CODAB zip downloaded by `download_codab`."""
+    iso3 = iso3.lower()
+    return gpd.read_file(
+        f"zip://{get_codab_path(iso3)}!{iso3}_adm{admin_level}.shp"
+    )
+
+
 def load_codab_from_blob(iso3: str, admin_level: int = 0):
     iso3 = iso3.lower()
     shapefile = f"{iso3}_adm{admin_level}.shp"
@@ -1,50 +1,127 @@
 import time
 
-import ocha_stratus as stratus
 import pandas as pd
 from dash import dcc
 from sqlalchemy import text
 
-from constants import CUR_YEAR, ROLLING_WINDOW, STAGE
+from constants import (
+    ADM_LEVELS,
+    ADMIN_LOOKUP_TTL,
+    CUR_YEAR,
+    DATA_VERSION_TTL,
+    EXPOSURE_PRELOAD,
+    ROLLING_WINDOW,
+)
+from utils.db_utils import get_connection
 from utils.log_utils import get_logger
+from utils.store_utils import get_exposure_table_name, get_preloaded_exposure
 
 logger = get_logger("data")
 
+ADM_LOOKUP_LEVELS = [str(adm_level) for adm_level in ADM_LEVELS] + ["region"]
 
-def fetch_flood_data(pcode, adm_level):
-    """Fetch flood exposure and administrative data from database."""
-    flood_table = (
-        "floodscan_exposure_regions"
-        if adm_level == "region"
-        else "floodscan_exposure"
-    )
+# app.admin_lookup rows, keyed by admin level and then pcode
+_admin_lookup = {"loaded": 0, "levels": {}}
+
+# Latest published valid_date, keyed by admin level
+_data_versions = {}
+
+# Current quantiles and the data version they are for, keyed by admin level
+_quantiles = {}
+
+
+def fetch_flood_data(pcode, adm_level, since=None):
+    """Fetch flood exposure and administrative data from database.
+
+    With `since`, only the exposure data after that date is fetched.
+    """
+    flood_table = get_exposure_table_name(adm_level)
 
+    params = {"pcode": pcode, "adm_level": adm_level}
+    date_filter = ""
+    if since is not None:
+        date_filter = "AND valid_date > :since"
+        params["since"] = since.date()
     query_exposure = text(
         f"""
         SELECT *
         FROM app.{flood_table}
-        WHERE pcode=:pcode AND adm_level=:adm_level
+        WHERE pcode=:pcode AND adm_level=:adm_level {date_filter}
         """
     )
-    params = {"pcode": pcode, "adm_level": adm_level}
-    query_adm = text("select * from app.admin_lookup")
     logger.info(f"Getting flood exposure data for {pcode}...")
     start = time.time()
-    engine = stratus.get_engine(STAGE)
-    with engine.connect() as con:
-        df_exposure = pd.read_sql_query(
-            query_exposure,
-            con,
-            params=params,
+    df_exposure = None
+    if EXPOSURE_PRELOAD:
+        df_exposure = get_preloaded_exposure(
+            pcode, adm_level, get_data_version(adm_level)
         )
-        df_adm = pd.read_sql_query(query_adm, con)
-        df_adm = df_adm[df_adm[f"adm{adm_level}_pcode"] == pcode]
+    if df_exposure is not None and since is not None:
+        df_exposure = df_exposure[
+            pd.to_datetime(df_exposure["valid_date"]) > since
+        ]
+    if df_exposure is None:
+        with get_connection() as con:
+            df_exposure = pd.read_sql_query(
+                query_exposure,
+                con,
+                params=params,
+            )
+    adm_names = get_admin_names(pcode, adm_level)
 
     elapsed = time.time() - start
     logger.debug(
         f"Retrieved {len(df_exposure)} rows from database in {elapsed:.2f}s"  # noqa
     )
-    return df_exposure, df_adm
+    return df_exposure, adm_names
+
+
+def get_admin_names(pcode, adm_level):
+    """Get the app.admin_lookup row for a pcode, as a dict.
+
+    The lookup table is loaded in full at most once per `ADMIN_LOOKUP_TTL`
+    and indexed by pcode for each admin level. Pcodes that aren't in the
+    loaded copy are queried from the database directly.
+    """
+    if adm_level not in ADM_LOOKUP_LEVELS:
+        raise ValueError(f"Invalid admin level: {adm_level}")
+    if time.time() - _admin_lookup["loaded"] > ADMIN_LOOKUP_TTL:
+        _load_admin_lookup()
+    adm_names = _admin_lookup["levels"].get(adm_level, {}).get(pcode)
+    if adm_names is not None:
+        return adm_names
+
+    pcode_col = f"adm{adm_level}_pcode"
+    query = text(
+        f"""
+        select * from app.admin_lookup
+        where {pcode_col}=:pcode
+        limit 1
+        """
+    )
+    with get_connection() as con:
+        df_adm = pd.read_sql_query(query, con, params={"pcode": pcode})
+    if df_adm.empty:
+        return None
+    return df_adm.iloc[0].to_dict()
+
+
+def _load_admin_lookup():
+    logger.info("Loading admin lookup...")
+    with get_connection() as con:
+        df_adm = pd.read_sql_query(text("select * from app.admin_lookup"), con)
+
+    levels = {}
+    for adm_level in ADM_LOOKUP_LEVELS:
+        pcode_col = f"adm{adm_level}_pcode"
+        if pcode_col not in df_adm.columns:
+            continue
+        df_level = df_adm.dropna(subset=pcode_col).drop_duplicates(pcode_col)
+        levels[adm_level] = df_level.set_index(pcode_col, drop=False).to_dict(
+            "index"
+        )
+    _admin_lookup["levels"] = levels
+    _admin_lookup["loaded"] = time.time()
 
 
 def process_flood_data(df_exposure):
@@ -87,46 +164,226 @@ def process_flood_data(df_exposure):
     return df_exposure, df_seasonal, df_peaks
 
 
+def update_flood_data(df_processed, df_seasonal, df_peaks, df_new):
+    """Add newly published exposure data to the output of
+    `process_flood_data`.
+
+    Only the rolling averages of the new days, and the peaks of each year up
+    to the new latest day of the year, are computed. The seasonal averages
+    are over past years only, so don't change. If the new data starts
+    before the latest processed day or in another year, all of the data is
+    processed again.
+    """
+    if df_new.empty:
+        return df_processed, df_seasonal, df_peaks
+
+    val_col = f"roll{ROLLING_WINDOW}"
+    df_new = df_new.rename(columns={"valid_date": "date"})
+    df_new["date"] = pd.to_datetime(df_new["date"])
+    df_new = df_new.sort_values("date")
+
+    last_date = df_processed["date"].iloc[-1]
+    if (
+        df_new["date"].iloc[0] <= last_date
+        or (df_new["date"].dt.year != last_date.year).any()
+        or last_date.year != CUR_YEAR
+    ):
+        # New data for days already processed replaces them
+        df_exposure = (
+            df_processed[~df_processed["date"].isin(df_new["date"])]
+            .drop(columns=[val_col, "dayofyear", "eff_date"])
+            .rename(columns={"date": "valid_date"})
+        )
+        return process_flood_data(
+            pd.concat(
+                [df_exposure, df_new.rename(columns={"date": "valid_date"})],
+                ignore_index=True,
+            )
+        )
+
+    # Rolling averages, over the end of the processed data and the new days
+    sums = pd.concat(
+        [df_processed["sum"].iloc[-(ROLLING_WINDOW - 1) :], df_new["sum"]],
+        ignore_index=True,
+    )
+    df_new[val_col] = (
+        sums.rolling(ROLLING_WINDOW).mean().iloc[-len(df_new) :].to_numpy()
+    )
+    df_new["dayofyear"] = df_new["date"].dt.dayofyear
+    df_new["eff_date"] = get_eff_date(df_new["dayofyear"])
+    df_processed = pd.concat([df_processed, df_new], ignore_index=True)
+
+    # Peaks, taking in the days of each year up to the new day of the year
+    last_dayofyear = last_date.dayofyear
+    today_dayofyear = df_new["dayofyear"].iloc[-1]
+    df_days = df_processed[
+        (df_processed["dayofyear"] > last_dayofyear)
+        & (df_processed["dayofyear"] <= today_dayofyear)
+    ]
+    df_new_peaks = df_days.groupby(df_days["date"].dt.year)[val_col].max()
+    df_peaks = (
+        pd.concat([df_peaks.set_index("date")[val_col], df_new_peaks])
+        .groupby(level=0)
+        .max()
+        .rename_axis("date")
+        .reset_index()
+    )
+    return df_processed, df_seasonal, df_peaks
+
+
+def process_flood_data_batch(df_exposure):
+    """Process flood data for many pcodes at once.
+
+    Gives the same output as calling `process_flood_data` on the data for each
+    pcode separately, with a pcode column in the seasonal and peak data to
+    tell the pcodes apart.
+    """
+    df_exposure = df_exposure.rename(columns={"valid_date": "date"})
+    df_exposure = df_exposure.sort_values(["pcode", "date"])
+
+    val_col = f"roll{ROLLING_WINDOW}"
+
+    # Calculate rolling averages
+    df_exposure[val_col] = (
+        df_exposure.groupby("pcode", sort=False)["sum"]
+        .rolling(ROLLING_WINDOW)
+        .mean()
+        .reset_index(level=0, drop=True)
+    )
+
+    # Calculate seasonal averages
+    df_exposure["date"] = pd.to_datetime(df_exposure["date"])
+    df_exposure["dayofyear"] = df_exposure["date"].dt.dayofyear
+    df_seasonal = (
+        df_exposure[df_exposure["date"].dt.year < CUR_YEAR]
+        .groupby(["pcode", "dayofyear"])[val_col]
+        .median()
+        .reset_index()
+    )
+    df_seasonal["eff_date"] = get_eff_date(df_seasonal["dayofyear"])
+
+    # Filter data, up to the latest day of the year for each pcode
+    today_dayofyear = df_exposure.groupby("pcode", sort=False)[
+        "dayofyear"
+    ].transform("last")
+    df_to_today = df_exposure[df_exposure["dayofyear"] <= today_dayofyear]
+
+    # Calculate peaks
+    df_peaks = (
+        df_to_today.groupby(["pcode", df_to_today["date"].dt.year])[val_col]
+        .max()
+        .reset_index()
+    )
+
+    df_exposure["eff_date"] = get_eff_date(df_exposure["dayofyear"])
+    return df_exposure, df_seasonal, df_peaks
+
+
+def get_eff_date(dayofyear):
+    """Get the date in 1900 for each day of the year.
+
+    Same as `pd.to_datetime(dayofyear, format="%j")`, without parsing each
+    value as a string.
+    """
+    return pd.Timestamp("1900-01-01") + pd.to_timedelta(dayofyear - 1, "D")
+
+
 def calculate_return_periods(df_peaks, rp: int = 3):
     """Calculate return periods for flood events."""
     df_peaks["rank"] = df_peaks[f"roll{ROLLING_WINDOW}"].rank(ascending=False)
     df_peaks["rp"] = (len(df_peaks) + 1) / df_peaks["rank"]
     df_peaks[f"{rp}yr_rp"] = df_peaks["rp"] >= rp
-    peak_years = df_peaks[df_peaks[f"{rp}yr_rp"]]["date"].to_list()
+    peak_years = get_peak_years(df_peaks, rp)
     return df_peaks.sort_values(by="rp"), peak_years
 
 
-def get_current_quantiles(adm_level):
-    quantile_table = (
-        "quantile_regions" if adm_level == "region" else "quantile"
+def calculate_return_periods_batch(df_peaks, rp: int = 3):
+    """Calculate return periods for the peaks of many pcodes at once.
+
+    Gives the same output as `calculate_return_periods` for each pcode.
+    """
+    val_col = f"roll{ROLLING_WINDOW}"
+    by_pcode = df_peaks.groupby("pcode")[val_col]
+    df_peaks["rank"] = by_pcode.rank(ascending=False)
+    df_peaks["rp"] = (by_pcode.transform("size") + 1) / df_peaks["rank"]
+    df_peaks[f"{rp}yr_rp"] = df_peaks["rp"] >= rp
+    return df_peaks.sort_values(by=["pcode", "rp"])
+
+
+def get_peak_years(df_peaks, rp: int = 3):
+    """Get the years with a peak of at least the given return period."""
+    return df_peaks[df_peaks[f"{rp}yr_rp"]]["date"].to_list()
+
+
+def get_quantile_table_name(adm_level):
+    return "quantile_regions" if adm_level == "region" else "quantile"
+
+
+def get_data_version(adm_level):
+    """Get the latest valid_date published for an admin level.
+
+    Used as a token to invalidate cached data once new data is published.
+    The database is checked at most once per `DATA_VERSION_TTL`.
+    """
+    cached = _data_versions.get(adm_level)
+    if cached is not None and time.time() - cached[0] <= DATA_VERSION_TTL:
+        return cached[1]
+
+    quantile_table = get_quantile_table_name(adm_level)
+    query = text(
+        f"""
+        select max(valid_date) from app.{quantile_table}
+        where adm_level=:adm_level
+        """
     )
+    with get_connection() as con:
+        version = con.execute(query, {"adm_level": adm_level}).scalar()
+    version = str(version)
+    _data_versions[adm_level] = (time.time(), version)
+    return version
+
+
+def get_current_quantiles(adm_level):
+    """Get the current quantiles for an admin level.
+
+    The table is cached per admin level and only queried again once a new
+    valid_date has been published, as checked by `get_data_version`. The
+    returned DataFrame is shared between callers and must not be modified.
+    """
+    data_version = get_data_version(adm_level)
+    cached = _quantiles.get(adm_level)
+    if cached is not None and cached[0] == data_version:
+        return cached[1]
+
+    quantile_table = get_quantile_table_name(adm_level)
 
-    engine = stratus.get_engine(STAGE)
     query = text(
         f"""
         select * from app.{quantile_table}
         where adm_level=:adm_level
         """
     )
-    with engine.connect() as con:
+    with get_connection() as con:
         df = pd.read_sql_query(query, con, params={"adm_level": adm_level})
+    _quantiles[adm_level] = (data_version, df)
     return df
 
 
-def get_summary(df_exposure, df_adm, adm_level, quantile):
-    name = df_adm.iloc[0][f"adm{adm_level}_name"]
-    adm0_name = df_adm.iloc[0]["adm0_name"]
+def get_quantile_classes(adm_level):
+    """Get the current quantile of each pcode in an admin level, as a dict."""
+    df = get_current_quantiles(adm_level).dropna(subset="quantile")
+    return dict(zip(df["pcode"], df["quantile"].astype(int).tolist()))
+
+
+def get_summary(df_exposure, adm_names, adm_level, quantile):
+    name = adm_names[f"adm{adm_level}_name"]
+    adm0_name = adm_names["adm0_name"]
     max_date = f"{df_exposure['date'].max():%b %d, %Y}"  # noqa
     val_col = f"roll{ROLLING_WINDOW}"
 
     df_ = df_exposure[df_exposure["date"] == max_date]
 
-    people_exposed = int(
-        df_.groupby([f"adm{adm_level}_pcode"])[val_col]
-        .sum()
-        .reset_index()
-        .iloc[0][val_col]
-    )
+    people_exposed = int(df_[val_col].sum())
     people_exposed_formatted = "{:,}".format(people_exposed)
 
     quantile_label = {
@@ -0,0 +1,115 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import ocha_stratus as stratus
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+from constants import (
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_SLOW_CHECKOUT,
+    DB_URL,
+    STAGE,
+)
+from utils.log_utils import get_logger
+
+logger = get_logger("db")
+
+# One engine (and so one connection pool) per process. The pid it was
+# created in is tracked so that a worker forked from a process that already
+# had an engine (e.g. with `gunicorn --preload`) creates its own, rather than
+# sharing pooled connections with its parent.
+_engine = None
+_engine_pid = None
+_lock = threading.Lock()
+
+# Connection checkout stats for this process, for sizing the pool
+pool_stats = {"checkouts": 0, "wait_total": 0.0, "wait_max": 0.0}
+
+
+def get_engine():
+    """Get the pooled database engine for this process."""
+    global _engine, _engine_pid
+    pid = os.getpid()
+    if _engine is not None and _engine_pid == pid:
+        return _engine
+
+    with _lock:
+        if _engine is not None and _engine_pid == pid:
+            return _engine
+        if _engine is not None:
+            # Leave the connections inherited from the parent to the parent
+            _engine.dispose(close=False)
+        _engine = _create_engine()
+        _engine_pid = pid
+    return _engine
+
+
+def _create_engine():
+    # Only used for its URL, so that credentials stay managed by stratus
+    url = make_url(DB_URL or stratus.get_engine(STAGE).url)
+    logger.info(
+        f"Creating database engine in process {os.getpid()} with pool size "
+        f"{DB_POOL_SIZE} (+{DB_MAX_OVERFLOW} overflow)"
+    )
+    is_sqlite = url.get_backend_name() == "sqlite"
+    engine = create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
+        # Read dates as dates, as from Postgres
+        connect_args=(
+            {"detect_types": sqlite3.PARSE_DECLTYPES} if is_sqlite else {}
+        ),
+    )
+    if is_sqlite:
+        _attach_app_schema(engine)
+    return engine
+
+
+def _attach_app_schema(engine):
+    """Make the tables of a SQLite stand-in database available in the `app`
+    schema, where they are queried from."""
+
+    @event.listens_for(engine, "connect")
+    def attach(dbapi_connection, _):
+        dbapi_connection.execute(
+            f"ATTACH DATABASE '{engine.url.database}' AS app"
+        )
+
+
+@contextmanager
+def get_connection():
+    """Check out a connection from the pool, logging how long it took."""
+    engine = get_engine()
+    start = time.time()
+    with engine.connect() as con:
+        wait = time.time() - start
+        _record_checkout(engine, wait)
+        yield con
+
+
+def _record_checkout(engine, wait):
+    pool_stats["checkouts"] += 1
+    pool_stats["wait_total"] += wait
+    pool_stats["wait_max"] = max(pool_stats["wait_max"], wait)
+    message = (
+        f"Connection checkout took {wait:.3f}s ({engine.pool.status()}, "
+        f"{pool_stats['checkouts']} checkouts, mean wait "
+        f"{pool_stats['wait_total'] / pool_stats['checkouts']:.3f}s, "
+        f"max wait {pool_stats['wait_max']:.3f}s)"
+    )
+    if wait > DB_SLOW_CHECKOUT:
+        logger.warning(message)
+    else:
+        logger.debug(message)
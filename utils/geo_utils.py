@@ -0,0 +1,350 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from constants import GEO_CACHE_DIR, GEO_LODS, GEO_MAX_AGE
+from utils.cache_utils import MemoryCache
+from utils.data_utils import get_current_quantiles, get_data_version
+from utils.log_utils import get_logger
+
+logger = get_logger("geo")
+
+GEO_DIR = "assets/geo"
+# Boundaries split up by country, for loading only the countries in view
+GEO_SHARD_DIR = os.path.join(GEO_DIR, "shards")
+
+# Parsed boundary files, keyed by file path. Each entry also holds the
+# mtime of the file it was read from, so that reruns of download_geodata.py
+# are picked up without restarting the workers, and a pcode -> feature
+# position index used to join values onto the features.
+_boundaries = {}
+_lock = threading.Lock()
+
+# Gzipped boundaries with the quantiles joined on, keyed by admin level and
+# level of detail
+_joined = {}
+
+# Gzipped TopoJSON boundaries, keyed by file path, with the mtime of the file
+_compressed = {}
+
+# Hashes of the contents of the boundary files, keyed by file path, with the
+# mtime of the file
+_file_hashes = {}
+
+# Features of each country's boundaries with the quantiles joined on, as
+# JSON, keyed by admin level, level of detail and ISO3
+_joined_shards = {}
+# Gzipped GeoJSON of the sets of countries requested, keyed by admin level,
+# level of detail, version and ISO3s, so that panning back and forth doesn't
+# rebuild them
+_shard_bodies = MemoryCache(max_entries=64, ttl=GEO_MAX_AGE)
+# Bounding boxes of the countries with shards, with the mtime of their file
+_shard_index = (None, None)
+
+
+def get_lod(adm_level, zoom, extension="json"):
+    """Get the level of detail of the boundaries to show at a map zoom.
+
+    Returns `None` (the default boundaries) if the zoom isn't known, or if
+    download_geodata.py hasn't been rerun to write the levels of detail yet.
+    """
+    if zoom is None:
+        return None
+    lod = max(i for i, lod in enumerate(GEO_LODS) if lod["min_zoom"] <= zoom)
+    if not os.path.exists(_get_lod_path(adm_level, lod, extension)):
+        return None
+    return lod
+
+
+def _get_lod_path(adm_level, lod, extension):
+    return os.path.join(GEO_DIR, f"adm{adm_level}_lod{lod}.{extension}")
+
+
+def _get_path(adm_level, lod, extension):
+    if lod is not None:
+        path = _get_lod_path(adm_level, lod, extension)
+        if os.path.exists(path):
+            return path
+    return os.path.join(GEO_DIR, f"adm{adm_level}.{extension}")
+
+
+def get_boundary_path(adm_level, lod=None):
+    return _get_path(adm_level, lod, "json")
+
+
+def load_boundaries(adm_level, lod=None):
+    """Load the boundary GeoJSON for an admin level, parsing it at most once
+    per worker (and again only if the file changes on disk).
+
+    The returned dict is shared between all callers and must not be
+    modified. Use `get_boundaries` to get a copy that can be.
+    """
+    return _get_entry(get_boundary_path(adm_level, lod))["data"]
+
+
+def get_pcode_index(adm_level, lod=None):
+    """Get the position of each pcode in the boundary features."""
+    return _get_entry(get_boundary_path(adm_level, lod))["index"]
+
+
+def _get_entry(path):
+    mtime = os.path.getmtime(path)
+    cached = _boundaries.get(path)
+    if cached is not None and cached["mtime"] == mtime:
+        return cached
+
+    with _lock:
+        cached = _boundaries.get(path)
+        if cached is not None and cached["mtime"] == mtime:
+            return cached
+        logger.info(f"Loading boundaries from {path}...")
+        with open(path, "r") as file:
+            data = json.load(file)
+        index = {
+            feature["properties"]["pcode"]: i
+            for i, feature in enumerate(data["features"])
+        }
+        cached = {"mtime": mtime, "data": data, "index": index}
+        _boundaries[path] = cached
+    return cached
+
+
+def get_flatgeobuf_path(adm_level, lod=None):
+    return _get_path(adm_level, lod, "fgb")
+
+
+def get_shard_path(adm_level, iso3, lod=None):
+    if lod is not None:
+        path = os.path.join(
+            GEO_SHARD_DIR, f"adm{adm_level}_lod{lod}_{iso3}.json"
+        )
+        if os.path.exists(path):
+            return path
+    return os.path.join(GEO_SHARD_DIR, f"adm{adm_level}_{iso3}.json")
+
+
+def get_shard_index():
+    """Get the bounding box of each country that has boundary shards, as
+    `[min_x, min_y, max_x, max_y]` by ISO3, or `None` if download_geodata.py
+    hasn't written any shards yet."""
+    global _shard_index
+    path = os.path.join(GEO_SHARD_DIR, "index.json")
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    if _shard_index[0] != mtime:
+        with open(path, "r") as file:
+            _shard_index = (mtime, json.load(file))
+    return _shard_index[1]
+
+
+def get_shards_in_view(bounds):
+    """Get the ISO3s of the countries that intersect the map bounds.
+
+    Returns `None` if all countries should be loaded, because the bounds
+    aren't known yet or there are no shards.
+    """
+    shard_index = get_shard_index()
+    if not bounds or shard_index is None:
+        return None
+    rect = bounds_to_rect(bounds)
+    return sorted(
+        iso3
+        for iso3, (min_x, min_y, max_x, max_y) in shard_index.items()
+        if min_x <= rect["maxX"]
+        and max_x >= rect["minX"]
+        and min_y <= rect["maxY"]
+        and max_y >= rect["minY"]
+    )
+
+
+def get_topojson_path(adm_level, lod=None):
+    return _get_path(adm_level, lod, "topojson")
+
+
+def get_file_version(path):
+    """Get a hash of the contents of a boundary file, which unlike its mtime
+    is the same on every instance serving it."""
+    mtime = os.path.getmtime(path)
+    cached = _file_hashes.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "rb") as file:
+            digest = hashlib.sha256(file.read()).hexdigest()[:16]
+        cached = (mtime, digest)
+        _file_hashes[path] = cached
+    return cached[1]
+
+
+def get_topojson_version(adm_level, lod=None):
+    return get_file_version(get_topojson_path(adm_level, lod))
+
+
+def get_compressed_topojson(adm_level, lod=None):
+    """Get the TopoJSON boundaries as gzipped bytes, along with their version
+    from `get_topojson_version`."""
+    path = get_topojson_path(adm_level, lod)
+    mtime = os.path.getmtime(path)
+    cached = _compressed.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "rb") as file:
+            body = gzip.compress(file.read(), compresslevel=9)
+        cached = (mtime, body)
+        _compressed[path] = cached
+    return get_file_version(path), cached[1]
+
+
+def bounds_to_rect(bounds):
+    """Convert map bounds to the bounding box used to read FlatGeobuf.
+
+    Without bounds (before the map has reported them), the whole world is
+    used.
+    """
+    if not bounds:
+        return {"minX": -180, "minY": -90, "maxX": 180, "maxY": 90}
+    (south, west), (north, east) = bounds
+    return {"minX": west, "minY": south, "maxX": east, "maxY": north}
+
+
+def get_boundaries(adm_level, lod=None):
+    """Get a copy of the boundary GeoJSON for an admin level.
+
+    Only the feature `properties` are copied, so callers are free to add or
+    change properties. Geometries are shared with the cached data and must
+    be treated as read-only.
+    """
+    return _copy_boundaries(load_boundaries(adm_level, lod))
+
+
+def _copy_boundaries(data):
+    features = [
+        {**feature, "properties": dict(feature["properties"])}
+        for feature in data["features"]
+    ]
+    return {**data, "features": features}
+
+
+def join_quantiles(data, df_quantile, adm_level, lod=None):
+    """Write the current quantile of each feature into its properties.
+
+    `data` must be a copy of the boundaries for `adm_level` and `lod` from
+    `get_boundaries`. Features without a quantile get `None`.
+    """
+    return _join_quantiles(data, df_quantile, get_pcode_index(adm_level, lod))
+
+
+def _join_quantiles(data, df_quantile, pcode_index):
+    features = data["features"]
+    quantiles = [None] * len(features)
+    positions = df_quantile["pcode"].map(pcode_index)
+    matched = positions.notna()
+    values = df_quantile.loc[matched, "quantile"]
+    for i, quantile in zip(
+        positions[matched].astype(int).tolist(),
+        values.astype(object).where(values.notna(), None).tolist(),
+    ):
+        quantiles[i] = quantile
+    for feature, quantile in zip(features, quantiles):
+        feature["properties"]["quantile"] = quantile
+    return data
+
+
+def get_joined_version(adm_level, lod=None):
+    """Get a token identifying the current boundaries and quantiles."""
+    file_version = get_file_version(get_boundary_path(adm_level, lod))
+    return f"{get_data_version(adm_level)}-{file_version}"
+
+
+def get_joined_geojson(adm_level, lod=None):
+    """Get the boundaries with the current quantiles joined on, as gzipped
+    GeoJSON, along with their version from `get_joined_version`.
+
+    Each version is built once and written to `GEO_CACHE_DIR`, where it is
+    shared with the other workers.
+    """
+    version = get_joined_version(adm_level, lod)
+    cached = _joined.get((adm_level, lod))
+    if cached is not None and cached[0] == version:
+        return cached
+
+    name = f"adm{adm_level}" if lod is None else f"adm{adm_level}_lod{lod}"
+    path = os.path.join(GEO_CACHE_DIR, f"{name}@{version}.json.gz")
+    if os.path.exists(path):
+        with open(path, "rb") as file:
+            body = file.read()
+    else:
+        logger.info(f"Building joined boundaries for admin {adm_level}...")
+        data = join_quantiles(
+            get_boundaries(adm_level, lod),
+            get_current_quantiles(adm_level),
+            adm_level,
+            lod,
+        )
+        body = gzip.compress(
+            json.dumps(data, separators=(",", ":")).encode(), compresslevel=9
+        )
+        _write_joined(path, body, name)
+    _joined[(adm_level, lod)] = (version, body)
+    return version, body
+
+
+def get_joined_shards(adm_level, iso3s, lod=None):
+    """Get the boundaries of only some countries with the current quantiles
+    joined on, as gzipped GeoJSON, along with their version from
+    `get_joined_version`.
+
+    Each country is joined once per version and level of detail, and only
+    when it is first requested. Each set of countries is compressed once
+    per version and level of detail.
+    """
+    version = get_joined_version(adm_level, lod)
+    key = (adm_level, lod, version, tuple(iso3s))
+    body = _shard_bodies.get(key)
+    if body is not None:
+        return version, body
+
+    parts = []
+    for iso3 in iso3s:
+        path = get_shard_path(adm_level, iso3, lod)
+        if not os.path.exists(path):
+            continue
+        cached = _joined_shards.get((adm_level, lod, iso3))
+        if cached is None or cached[0] != version:
+            logger.info(f"Joining {iso3} boundaries for admin {adm_level}...")
+            entry = _get_entry(path)
+            data = _join_quantiles(
+                _copy_boundaries(entry["data"]),
+                get_current_quantiles(adm_level),
+                entry["index"],
+            )
+            features = json.dumps(data["features"], separators=(",", ":"))
+            # Strip the brackets, so that countries can be concatenated
+            cached = (version, features[1:-1])
+            _joined_shards[(adm_level, lod, iso3)] = cached
+        if cached[1]:
+            parts.append(cached[1])
+    body = '{"type":"FeatureCollection","features":[' + ",".join(parts) + "]}"
+    body = gzip.compress(body.encode(), compresslevel=9)
+    _shard_bodies.set(key, body)
+    return version, body
+
+
+def _write_joined(path, body, name):
+    os.makedirs(GEO_CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=GEO_CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "wb") as file:
+        file.write(body)
+    os.replace(tmp_path, path)
+    # Clean up older versions
+    for entry in os.scandir(GEO_CACHE_DIR):
+        if (
+            entry.name.startswith(f"{name}@")
+            and entry.name.endswith(".json.gz")
+            and entry.path != path
+        ):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
@@ -0,0 +1,106 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.log_utils import get_logger
+
+logger = get_logger("metrics")
+
+SECONDS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+BYTES_BUCKETS = [1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 5e6]
+
+
+class Histogram:
+    """Prometheus-style histogram, with a series per value of one label.
+
+    Metrics are kept per worker process.
+    """
+
+    def __init__(self, name, description, label, buckets):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.setdefault(
+                label_value,
+                {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0},
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            for label_value, series in sorted(self._series.items()):
+                label = f'{self.label}="{label_value}"'
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    lines.append(
+                        f'{self.name}_bucket{{{label},le="{bound:g}"}} {count}'
+                    )
+                lines.append(
+                    f'{self.name}_bucket{{{label},le="+Inf"}} '
+                    f'{series["count"]}'
+                )
+                lines.append(f"{self.name}_sum{{{label}}} {series['sum']}")
+                lines.append(f"{self.name}_count{{{label}}} {series['count']}")
+        return lines
+
+
+span_seconds = Histogram(
+    "app_span_seconds",
+    "Time spent in each phase of handling a request",
+    "span",
+    SECONDS_BUCKETS,
+)
+callback_seconds = Histogram(
+    "app_callback_request_seconds",
+    "Time to handle a callback request, including serializing its outputs",
+    "callback",
+    SECONDS_BUCKETS,
+)
+callback_payload_bytes = Histogram(
+    "app_callback_payload_bytes",
+    "Size of callback responses, before compression",
+    "callback",
+    BYTES_BUCKETS,
+)
+
+
+@contextmanager
+def span(name):
+    """Time a phase of handling a request into `span_seconds`.
+
+    Can be used as a `with` block or as a decorator.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        span_seconds.observe(name, elapsed)
+        logger.debug(f"{name} took {elapsed * 1000:.1f}ms")
+
+
+def render_metrics(counters, gauges):
+    """Render the histograms, and counters and gauges given as dicts of name
+    to (description, value), in the Prometheus text format."""
+    lines = []
+    for histogram in [span_seconds, callback_seconds, callback_payload_bytes]:
+        lines.extend(histogram.render())
+    for metric_type, metrics in [("counter", counters), ("gauge", gauges)]:
+        for name, (description, value) in metrics.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,147 @@
+import time
+
+from constants import CLIENTSIDE_CHARTS, EXPOSURE_HISTORY
+from utils.cache_utils import create_cache
+from utils.chart_utils import (
+    create_return_period_plot,
+    create_timeseries_plot,
+    get_chart_data,
+)
+from utils.data_utils import (
+    calculate_return_periods,
+    fetch_flood_data,
+    get_admin_names,
+    get_data_version,
+    get_peak_years,
+    get_summary,
+    process_flood_data,
+    update_flood_data,
+)
+from utils.log_utils import get_logger
+from utils.metrics_utils import span
+from utils.store_utils import (
+    get_precomputed_stats,
+    read_exposure_history,
+    write_exposure_history,
+)
+
+logger = get_logger("pipeline")
+
+result_cache = create_cache("plots")
+
+
+def get_plot_outputs(pcode, adm_level, quantile):
+    """Get the charts and summary for a location, from the cache if possible.
+
+    Results are keyed on the latest published data version, so they are
+    recomputed once new data comes in. Requests for a location that is
+    already being computed wait for that result, across workers with the
+    `filesystem` cache. Returns `None` if there is no data for the location.
+    """
+    data_version = get_data_version(adm_level)
+    if result_cache is None:
+        return compute_plot_outputs(pcode, adm_level, quantile, data_version)
+
+    key = (pcode, adm_level, quantile, data_version)
+    # Concurrent requests for the same location wait for the first one to
+    # compute the result, rather than all computing it
+    with result_cache.lock(key):
+        with span("result_cache_get"):
+            outputs = result_cache.get(key)
+        logger.debug(
+            f"Result cache {'hit' if outputs else 'miss'} for {pcode} "
+            f"({result_cache.hits} hits, {result_cache.misses} misses)"
+        )
+        if outputs is None:
+            outputs = compute_plot_outputs(
+                pcode, adm_level, quantile, data_version
+            )
+            if outputs is not None:
+                result_cache.set(key, outputs)
+    return outputs
+
+
+def compute_plot_outputs(pcode, adm_level, quantile, data_version):
+    """Build the charts for a location, or only their data with
+    `CLIENTSIDE_CHARTS`, from the stats precomputed by precompute_stats.py if
+    they are up to date, otherwise from the database.
+    """
+    with span("get_precomputed_stats"):
+        stats = get_precomputed_stats(pcode, adm_level, data_version)
+    if stats is not None:
+        df_processed, df_seasonal, df_peaks = stats
+        peak_years = get_peak_years(df_peaks)
+    else:
+        processed = get_processed_flood_data(pcode, adm_level, data_version)
+        if processed is None:
+            return None
+        df_processed, df_seasonal, df_peaks = processed
+        with span("calculate_return_periods"):
+            df_peaks, peak_years = calculate_return_periods(df_peaks)
+    adm_names = get_admin_names(pcode, adm_level)
+
+    name, summary = get_summary(df_processed, adm_names, adm_level, quantile)
+    outputs = {"name": name, "summary": summary}
+    if CLIENTSIDE_CHARTS:
+        # The charts are drawn in the browser, by assets/charts.js
+        with span("get_chart_data"):
+            outputs["chart_data"] = get_chart_data(
+                df_seasonal, df_processed, df_peaks, peak_years
+            )
+        return outputs
+
+    # Create plots
+    with span("create_timeseries_plot"):
+        fig_timeseries = create_timeseries_plot(
+            df_seasonal, df_processed, peak_years
+        )
+    with span("create_return_period_plot"):
+        fig_rp = create_return_period_plot(df_peaks)
+    with span("figures_to_dict"):
+        outputs["fig_timeseries"] = fig_timeseries.to_dict()
+        outputs["fig_rp"] = fig_rp.to_dict()
+    return outputs
+
+
+def get_processed_flood_data(pcode, adm_level, data_version):
+    """Get the processed, seasonal and peak data for a location.
+
+    With `EXPOSURE_HISTORY`, the data kept on disk from earlier requests is
+    used if up to date, or else updated with only the days published since.
+    Otherwise, all of the location's data is fetched and processed. Returns
+    `None` if there is no data for the location.
+    """
+    history = None
+    if EXPOSURE_HISTORY:
+        with span("read_exposure_history"):
+            history = read_exposure_history(pcode, adm_level)
+    if history is not None and history["data_version"] == data_version:
+        return history["tables"]
+
+    if history is not None:
+        df_processed, df_seasonal, df_peaks = history["tables"]
+        with span("fetch_flood_data"):
+            df_new, _ = fetch_flood_data(
+                pcode, adm_level, since=df_processed["date"].max()
+            )
+        with span("update_flood_data"):
+            tables = update_flood_data(
+                df_processed, df_seasonal, df_peaks, df_new
+            )
+        synced = history["synced"]
+    else:
+        synced = time.time()
+        with span("fetch_flood_data"):
+            df_exposure, _ = fetch_flood_data(pcode, adm_level)
+        if len(df_exposure) == 0:
+            return None
+        with span("process_flood_data"):
+            tables = process_flood_data(df_exposure)
+
+    if EXPOSURE_HISTORY:
+        # Written before the return periods are added to the peaks
+        with span("write_exposure_history"):
+            write_exposure_history(
+                pcode, adm_level, tables, data_version, synced
+            )
+    return tables
@@ -0,0 +1,319 @@
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import text
+
+from constants import (
+    EXPOSURE_HISTORY_DIR,
+    EXPOSURE_HISTORY_MAX_AGE,
+    EXPOSURE_PRELOAD_CHUNKSIZE,
+    EXPOSURE_PRELOAD_MAX_MB,
+    EXPOSURE_PRELOAD_TTL,
+    STATS_DIR,
+)
+from utils.db_utils import get_connection
+from utils.log_utils import get_logger
+
+logger = get_logger("store")
+
+# Preloaded exposure tables, keyed by admin level. Levels that didn't fit in
+# the memory budget are kept with a table of `None`, so that we don't retry
+# loading them until the next refresh.
+_exposure = {}
+_exposure_locks = {}
+_lock = threading.Lock()
+
+# Precomputed stats from precompute_stats.py, keyed by admin level
+_stats = {}
+
+# Stats tables written for each admin level, and the columns they are sorted
+# by within each pcode
+STATS_KINDS = {
+    "processed": [("date", "ascending")],
+    "seasonal": [("dayofyear", "ascending")],
+    "peaks": [("rp", "ascending")],
+}
+
+
+def index_table(table, sort_keys):
+    """Sort an Arrow table by pcode and index the row range of each pcode.
+
+    Returns the sorted table and a dict of pcode -> (offset, length), so that
+    the rows for a pcode can be taken with a zero-copy `table.slice`.
+    """
+    table = table.sort_by([("pcode", "ascending")] + sort_keys)
+    pcodes = table.column("pcode").combine_chunks().dictionary_encode()
+    codes = pcodes.indices.to_numpy(zero_copy_only=False)
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(codes)) + 1])
+    lengths = np.diff(np.append(starts, len(codes)))
+    names = pcodes.dictionary.to_pylist()
+    offsets = {
+        names[codes[start]]: (int(start), int(length))
+        for start, length in zip(starts, lengths)
+    }
+    return table, offsets
+
+
+def slice_table(table, offsets, pcode):
+    """Get the rows for a pcode from an indexed table as a DataFrame."""
+    offset, length = offsets.get(pcode, (0, 0))
+    return table.slice(offset, length).to_pandas()
+
+
+def get_exposure_table_name(adm_level):
+    return (
+        "floodscan_exposure_regions"
+        if adm_level == "region"
+        else "floodscan_exposure"
+    )
+
+
+def get_preloaded_exposure(pcode, adm_level, data_version):
+    """Get the exposure data for a pcode from the in-memory store.
+
+    Loads the whole exposure table for `adm_level` on first use, and again
+    once `data_version` is newer than the loaded one or it is older than
+    `EXPOSURE_PRELOAD_TTL`. Returns `None` if the level doesn't fit in the
+    memory budget or is being loaded by another thread, in which case the
+    caller should fall back to querying the database.
+    """
+    entry = _exposure.get(adm_level)
+    if not _is_current(entry, data_version):
+        entry = _refresh_exposure(adm_level, data_version)
+    if entry is None or entry["table"] is None:
+        return None
+    return slice_table(entry["table"], entry["offsets"], pcode)
+
+
+def _is_current(entry, data_version):
+    return (
+        entry is not None
+        and entry["data_version"] == data_version
+        and time.time() - entry["loaded"] <= EXPOSURE_PRELOAD_TTL
+    )
+
+
+def _refresh_exposure(adm_level, data_version):
+    with _lock:
+        level_lock = _exposure_locks.setdefault(adm_level, threading.Lock())
+    if not level_lock.acquire(blocking=False):
+        # Being loaded by another thread, so fall back to the database
+        return None
+    try:
+        entry = _exposure.get(adm_level)
+        if _is_current(entry, data_version):
+            return entry
+        # Release the old table before loading the new one so they don't
+        # both count against the memory budget
+        _exposure.pop(adm_level, None)
+        budget = EXPOSURE_PRELOAD_MAX_MB * 1024**2 - sum(
+            e["table"].nbytes
+            for e in _exposure.values()
+            if e["table"] is not None
+        )
+        try:
+            table = _load_exposure_table(adm_level, budget)
+        except Exception as e:
+            # Fall back to the database until the next refresh, rather than
+            # retrying the whole load on every request
+            logger.error(
+                f"Could not preload admin {adm_level} exposure data, falling "
+                f"back to the database: {e}"
+            )
+            table = None
+        offsets = None
+        if table is not None:
+            table, offsets = index_table(table, [("valid_date", "ascending")])
+        # Tagged with the version taken before loading, so that data
+        # published during the load makes the table stale, not mislabelled
+        entry = {
+            "table": table,
+            "offsets": offsets,
+            "data_version": data_version,
+            "loaded": time.time(),
+        }
+        _exposure[adm_level] = entry
+        return entry
+    finally:
+        level_lock.release()
+
+
+def _load_exposure_table(adm_level, budget):
+    table_name = get_exposure_table_name(adm_level)
+    query = text(
+        f"""
+        SELECT *
+        FROM app.{table_name}
+        WHERE adm_level=:adm_level
+        """
+    )
+    logger.info(f"Preloading {table_name} for admin {adm_level}...")
+    start = time.time()
+    chunks = []
+    nbytes = 0
+    with get_connection() as con:
+        con = con.execution_options(stream_results=True)
+        for df_chunk in pd.read_sql_query(
+            query,
+            con,
+            params={"adm_level": adm_level},
+            chunksize=EXPOSURE_PRELOAD_CHUNKSIZE,
+        ):
+            chunk = pa.Table.from_pandas(df_chunk, preserve_index=False)
+            nbytes += chunk.nbytes
+            if nbytes > budget:
+                logger.warning(
+                    f"Admin {adm_level} exposure data doesn't fit in the "
+                    f"preload memory budget, falling back to the database"
+                )
+                return None
+            chunks.append(chunk)
+
+    elapsed = time.time() - start
+    if not chunks:
+        return None
+    table = pa.concat_tables(chunks, promote_options="default")
+    logger.info(
+        f"Preloaded {table.num_rows} rows ({nbytes / 1024**2:.1f} MB) for "
+        f"admin {adm_level} in {elapsed:.2f}s"
+    )
+    return table
+
+
+def get_stats_path(adm_level, kind):
+    return os.path.join(STATS_DIR, f"adm{adm_level}_{kind}.parquet")
+
+
+def write_stats(tables, adm_level, data_version):
+    """Write the precomputed stats tables for an admin level.
+
+    `tables` maps each of `STATS_KINDS` to a DataFrame with a pcode column.
+    Each file is tagged with the data version it was computed from, and
+    replaced atomically so the app never reads a partially written file.
+    """
+    os.makedirs(STATS_DIR, exist_ok=True)
+    for kind, df in tables.items():
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata(
+            {**table.schema.metadata, b"data_version": data_version.encode()}
+        )
+        fd, tmp_path = tempfile.mkstemp(dir=STATS_DIR, suffix=".tmp")
+        os.close(fd)
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, get_stats_path(adm_level, kind))
+
+
+def get_precomputed_stats(pcode, adm_level, data_version):
+    """Get the precomputed processed, seasonal and peak data for a pcode.
+
+    Returns `None` if there are no stats for the admin level, if they were
+    computed from an older data version than `data_version`, or if they
+    don't include the pcode.
+    """
+    entry = _load_stats(adm_level)
+    if entry is None or entry["data_version"] != data_version:
+        return None
+    if pcode not in entry["processed"][1]:
+        return None
+    return tuple(
+        slice_table(*entry[kind], pcode) for kind in STATS_KINDS.keys()
+    )
+
+
+def _load_stats(adm_level):
+    paths = [get_stats_path(adm_level, kind) for kind in STATS_KINDS.keys()]
+    try:
+        mtimes = [os.path.getmtime(path) for path in paths]
+    except OSError:
+        return None
+    cached = _stats.get(adm_level)
+    if cached is not None and cached["mtimes"] == mtimes:
+        return cached
+
+    with _lock:
+        cached = _stats.get(adm_level)
+        if cached is not None and cached["mtimes"] == mtimes:
+            return cached
+        logger.info(f"Loading precomputed stats for admin {adm_level}...")
+        entry = {"mtimes": mtimes}
+        versions = set()
+        for kind, path in zip(STATS_KINDS.keys(), paths):
+            table = pq.read_table(path)
+            versions.add(table.schema.metadata.get(b"data_version"))
+            entry[kind] = index_table(table, STATS_KINDS[kind])
+        # Files from different runs of the job can't be used together
+        entry["data_version"] = (
+            versions.pop().decode() if len(versions) == 1 else None
+        )
+        _stats[adm_level] = entry
+    return entry
+
+
+def get_history_path(pcode, adm_level, kind):
+    return os.path.join(
+        EXPOSURE_HISTORY_DIR, f"adm{adm_level}", pcode, f"{kind}.parquet"
+    )
+
+
+def write_exposure_history(pcode, adm_level, tables, data_version, synced):
+    """Keep the processed, seasonal and peak data for a pcode on disk.
+
+    Each file is tagged with the data version it is up to date with and the
+    time its whole history was last fetched (`synced`), and replaced
+    atomically so that other workers never read a partially written file.
+    """
+    directory = os.path.dirname(get_history_path(pcode, adm_level, "peaks"))
+    os.makedirs(directory, exist_ok=True)
+    metadata = {
+        b"data_version": data_version.encode(),
+        b"synced": str(synced).encode(),
+    }
+    for kind, df in zip(STATS_KINDS.keys(), tables):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata(
+            {**table.schema.metadata, **metadata}
+        )
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        os.close(fd)
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, get_history_path(pcode, adm_level, kind))
+
+
+def read_exposure_history(pcode, adm_level):
+    """Read the data kept by `write_exposure_history` for a pcode.
+
+    Returns a dict with the tables, their data version and when their whole
+    history was fetched, or `None` if there are none, they were written at
+    different times, or their history is older than
+    `EXPOSURE_HISTORY_MAX_AGE`.
+    """
+    tables = []
+    metadata = set()
+    for kind in STATS_KINDS.keys():
+        try:
+            table = pq.read_table(get_history_path(pcode, adm_level, kind))
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None
+        metadata.add(
+            (
+                table.schema.metadata.get(b"data_version"),
+                table.schema.metadata.get(b"synced"),
+            )
+        )
+        tables.append(table.to_pandas())
+    if len(metadata) != 1:
+        return None
+    data_version, synced = metadata.pop()
+    if time.time() - float(synced) > EXPOSURE_HISTORY_MAX_AGE:
+        return None
+    return {
+        "tables": tuple(tables),
+        "data_version": data_version.decode(),
+        "synced": float(synced),
+    }
@@ -0,0 +1,181 @@
+import os
+import tempfile
+import itertools
+import threading
+import time
+from collections import Counter, deque
+
+from constants import (
+    DATA_VERSION_TTL,
+    GEO_LODS,
+    GEO_SHARDED,
+    ISO3S,
+    MAP_FORMAT,
+    SELECTION_LOG,
+    SELECTION_LOG_MAX_LINES,
+    SELECTION_LOG_TRIM_EVERY,
+    WARMUP,
+    WARMUP_PCODES,
+    WARMUP_TOP_N,
+)
+from utils.data_utils import (
+    ADM_LOOKUP_LEVELS,
+    get_current_quantiles,
+    get_data_version,
+    get_quantile_classes,
+)
+from utils.geo_utils import (
+    get_compressed_topojson,
+    get_joined_geojson,
+    get_joined_shards,
+)
+from utils.log_utils import get_logger
+from utils.pipeline_utils import get_plot_outputs
+
+logger = get_logger("warmup")
+
+_started = {"pid": None}
+
+# Selections appended to the log by this worker
+_appends = itertools.count(1)
+
+
+def record_selection(pcode, adm_level):
+    """Append a selected location to `SELECTION_LOG`, to rank the locations
+    to warm up by popularity.
+
+    Only recorded with `WARMUP`, the only reader of the log. Every
+    `SELECTION_LOG_TRIM_EVERY` selections, the log is trimmed if it has
+    grown past twice `SELECTION_LOG_MAX_LINES`.
+    """
+    if not WARMUP:
+        return
+    try:
+        os.makedirs(os.path.dirname(SELECTION_LOG) or ".", exist_ok=True)
+        # Lines this short are appended whole, even from several workers
+        with open(SELECTION_LOG, "a") as file:
+            file.write(f"{adm_level},{pcode}\n")
+        if next(_appends) % SELECTION_LOG_TRIM_EVERY == 0:
+            read_selection_log()
+    except OSError as e:
+        logger.warning(f"Could not record selection of {pcode}: {e}")
+
+
+def read_selection_log():
+    """Get the latest `SELECTION_LOG_MAX_LINES` lines of `SELECTION_LOG`,
+    trimming the file to them if it has grown past twice as many."""
+    lines = deque(maxlen=SELECTION_LOG_MAX_LINES)
+    n_lines = 0
+    try:
+        with open(SELECTION_LOG) as file:
+            for line in file:
+                lines.append(line)
+                n_lines += 1
+    except FileNotFoundError:
+        return []
+    if n_lines > 2 * SELECTION_LOG_MAX_LINES:
+        _trim_selection_log(lines)
+    return lines
+
+
+def get_popular_locations(n):
+    """Get the `n` most selected (adm_level, pcode) in the latest
+    `SELECTION_LOG_MAX_LINES` selections, most popular first."""
+    counts = Counter(
+        tuple(line.strip().split(",", 1))
+        for line in read_selection_log()
+        if "," in line
+    )
+    return [location for location, _ in counts.most_common(n)]
+
+
+def _trim_selection_log(lines):
+    # Selections recorded while the log is rewritten are lost, which is fine
+    # for ranking by popularity
+    directory = os.path.dirname(SELECTION_LOG) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as file:
+        file.writelines(lines)
+    os.replace(tmp_path, SELECTION_LOG)
+
+
+def get_warmup_locations():
+    """Get the locations to warm up: those in `WARMUP_PCODES`, then the most
+    popular ones."""
+    locations = [
+        tuple(location.strip().split(":", 1))
+        for location in WARMUP_PCODES.split(",")
+        if ":" in location
+    ]
+    for location in get_popular_locations(WARMUP_TOP_N):
+        if location not in locations:
+            locations.append(location)
+    return locations
+
+
+def warm_boundaries(adm_level):
+    if MAP_FORMAT == "geojson" and GEO_SHARDED:
+        for lod in [None, *range(len(GEO_LODS))]:
+            get_joined_shards(adm_level, sorted(ISO3S), lod)
+    elif MAP_FORMAT == "geojson":
+        for lod in [None, *range(len(GEO_LODS))]:
+            get_joined_geojson(adm_level, lod)
+    elif MAP_FORMAT == "topojson":
+        for lod in [None, *range(len(GEO_LODS))]:
+            get_compressed_topojson(adm_level, lod)
+
+
+def warm_up():
+    """Load the quantiles and boundaries of all admin levels, and the charts
+    of the locations from `get_warmup_locations`, into the caches."""
+    start = time.time()
+    for adm_level in ADM_LOOKUP_LEVELS:
+        try:
+            get_current_quantiles(adm_level)
+            warm_boundaries(adm_level)
+        except Exception as e:
+            logger.warning(f"Could not warm up admin {adm_level}: {e}")
+
+    locations = [
+        (adm_level, pcode)
+        for adm_level, pcode in get_warmup_locations()
+        if adm_level in ADM_LOOKUP_LEVELS
+    ]
+    quantiles = {}
+    for adm_level, pcode in locations:
+        if adm_level not in quantiles:
+            quantiles[adm_level] = get_quantile_classes(adm_level)
+        quantile = quantiles[adm_level].get(pcode)
+        if quantile is None:
+            continue
+        try:
+            get_plot_outputs(pcode, adm_level, quantile)
+        except Exception as e:
+            logger.warning(f"Could not warm up {pcode}: {e}")
+    logger.info(
+        f"Warmed up {len(locations)} locations in {time.time() - start:.1f}s"
+    )
+
+
+def _run():
+    versions = None
+    while True:
+        try:
+            new_versions = [
+                get_data_version(level) for level in ADM_LOOKUP_LEVELS
+            ]
+            if new_versions != versions:
+                warm_up()
+                versions = new_versions
+        except Exception as e:
+            logger.warning(f"Warm-up failed: {e}")
+        time.sleep(DATA_VERSION_TTL)
+
+
+def start_warmup():
+    """Warm up the caches in a background thread, now and whenever new data
+    is published. Runs once per process."""
+    if _started["pid"] == os.getpid():
+        return
+    _started["pid"] = os.getpid()
+    threading.Thread(target=_run, name="warmup", daemon=True).start()